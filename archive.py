@@ -0,0 +1,432 @@
+# archive.py
+"""
+Архив заказов по месяцам: ARCHIVE_DIR/2025-08.jsonl — текущие месяцы,
+ARCHIVE_DIR/2025-07.jsonl.gz — закрытые (после rotate). Рядом index.jsonl:
+по строке на заказ [timestamp, клиент, менеджер, сегмент, смещение, длина],
+смещения — в несжатом содержимом сегмента. Поиск по клиенту, менеджеру
+или месяцу читает только нужные сегменты.
+
+    python archive.py [--dir orders_archive] stats|rotate|compact|import FILE
+"""
+import argparse
+import gzip
+import json
+import mmap
+import os
+import shutil
+import threading
+from datetime import datetime
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "orders_archive")
+INDEX_FILE = "index.jsonl"
+UNDATED = "undated"  # сегмент для заказов без timestamp
+
+
+def segment_of(order):
+    """Месяц заказа "YYYY-MM" по его timestamp."""
+    timestamp = str(order.get("timestamp", ""))
+    return timestamp[:7] if len(timestamp) >= 7 and timestamp[4] == "-" else UNDATED
+
+
+def _index_entry(order, segment, offset, length):
+    return [order.get("timestamp", ""), order.get("client", ""), order.get("manager", ""), segment, offset, length]
+
+
+class OrderArchive:
+    """
+    Архив заказов, разбитый на месячные сегменты, с индексом смещений.
+    Запись — дозапись строки в сегмент месяца и строки в индекс.
+    Индекс сверяется с размерами открытых сегментов при первом обращении:
+    строки, дописанные в сегмент без индекса (сбой между записями), доиндексируются.
+    """
+
+    def __init__(self, directory=ARCHIVE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._entries = None
+        self._gz_cache = (None, None)
+
+    # ---------- пути ----------
+    def _plain_path(self, segment):
+        return os.path.join(self.directory, f"{segment}.jsonl")
+
+    def _gz_path(self, segment):
+        return os.path.join(self.directory, f"{segment}.jsonl.gz")
+
+    @property
+    def index_path(self):
+        return os.path.join(self.directory, INDEX_FILE)
+
+    def segments(self):
+        """Имена сегментов по порядку: {"2025-07": "gz", "2025-08": "plain"}."""
+        found = {}
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(".jsonl.gz"):
+                    found[name[:-len(".jsonl.gz")]] = "gz"
+                elif name.endswith(".jsonl") and name != INDEX_FILE:
+                    found.setdefault(name[:-len(".jsonl")], "plain")
+        return dict(sorted(found.items()))
+
+    def exists(self):
+        return os.path.exists(self.index_path)
+
+    # ---------- индекс ----------
+    def _load_index(self):
+        if self._entries is not None:
+            return self._entries
+        entries = []
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        pass  # недописанная строка индекса — восстановится из сегмента
+        except FileNotFoundError:
+            pass
+        self._entries = entries
+        self._reconcile()
+        return entries
+
+    def _reconcile(self):
+        """Сверяет индекс с открытыми сегментами и доиндексирует хвосты."""
+        ends = {}
+        for entry in self._entries:
+            ends[entry[3]] = max(ends.get(entry[3], 0), entry[4] + entry[5])
+        added = []
+        for segment, kind in self.segments().items():
+            if kind != "plain":
+                continue
+            size = os.path.getsize(self._plain_path(segment))
+            end = ends.get(segment, 0)
+            if size < end:
+                # Сегмент короче индекса (восстановлен из копии) — лишние записи убираем
+                self._entries = [e for e in self._entries if e[3] != segment or e[4] + e[5] <= size]
+            elif size > end:
+                added += self._scan(segment, end)
+        if added:
+            print(f"⚠️ Архив: доиндексировано {len(added)} заказов")
+            self._entries += added
+            self._append_index(added)
+
+    def _scan(self, segment, start=0):
+        """Индексные записи для строк сегмента начиная со смещения start."""
+        entries = []
+        with open(self._plain_path(segment), "rb") as f:
+            f.seek(start)
+            offset = start
+            for line in f:
+                if line.strip() and line.endswith(b"\n"):
+                    try:
+                        entries.append(_index_entry(json.loads(line), segment, offset, len(line)))
+                    except ValueError:
+                        pass
+                offset += len(line)
+        return entries
+
+    def _append_index(self, entries):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def _rewrite_index(self, entries):
+        tmp_file = self.index_path + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.index_path)
+        self._entries = entries
+
+    # ---------- запись ----------
+    def append(self, order):
+        """Дописывает заказ в сегмент его месяца и в индекс."""
+        self.append_many([order])
+
+    def append_many(self, orders):
+        """Группа заказов одной записью: один fsync на сегмент, одна дозапись индекса."""
+        with self._lock:
+            self._load_index()
+            return self._append_many(orders)
+
+    def import_orders(self, orders):
+        """
+        Пакетная запись (миграция): fsync раз на 1000 заказов. Возвращает число заказов.
+        В пустой архив заказы пишутся во временную папку, которая встаёт на место
+        одним os.replace в конце: если процесс упал посреди импорта, архива ещё нет
+        (exists() ложно), и следующий запуск переносит всё заново.
+        """
+        with self._lock:
+            if os.path.isdir(self.directory) and os.listdir(self.directory):
+                # Импорт в архив с данными (python archive.py import) — дозапись
+                self._load_index()
+                return self._import(orders)
+            staging = OrderArchive(os.path.normpath(self.directory) + ".importing")
+            shutil.rmtree(staging.directory, ignore_errors=True)  # остаток прерванного импорта
+            staging._entries = []
+            count = staging._import(orders)
+            if os.path.isdir(self.directory):
+                os.rmdir(self.directory)
+            os.replace(staging.directory, self.directory)
+            self._entries = None
+            self._gz_cache = (None, None)
+            return count
+
+    def _import(self, orders):
+        count = 0
+        batch = []
+        for order in orders:
+            batch.append(order)
+            if len(batch) >= 1000:
+                count += self._append_many(batch)
+                batch = []
+        count += self._append_many(batch)
+        return count
+
+    def _append_many(self, orders):
+        os.makedirs(self.directory, exist_ok=True)
+        by_segment = {}
+        for order in orders:
+            by_segment.setdefault(segment_of(order), []).append(order)
+        entries = []
+        for segment, segment_orders in by_segment.items():
+            if os.path.exists(self._gz_path(segment)):
+                self._reopen(segment)
+            path = self._plain_path(segment)
+            with open(path, "ab") as f:
+                offset = f.tell()
+                if offset and not self._ends_with_newline(path, offset):
+                    # Хвост недописанной строки после сбоя не должен склеиться с новым заказом
+                    f.write(b"\n")
+                    offset += 1
+                for order in segment_orders:
+                    line = (json.dumps(order, ensure_ascii=False) + "\n").encode("utf-8")
+                    f.write(line)
+                    entries.append(_index_entry(order, segment, offset, len(line)))
+                    offset += len(line)
+                f.flush()
+                os.fsync(f.fileno())
+        self._append_index(entries)
+        self._entries += entries
+        return len(orders)
+
+    @staticmethod
+    def _ends_with_newline(path, size):
+        with open(path, "rb") as f:
+            f.seek(size - 1)
+            return f.read(1) == b"\n"
+
+    def _reopen(self, segment):
+        # Заказ в уже сжатый месяц (импорт, сбитые часы): распаковываем сегмент обратно,
+        # смещения в индексе остаются верными — они считаются в несжатом содержимом
+        print(f"⚠️ Архив: дозапись в закрытый месяц {segment}")
+        plain, gz = self._plain_path(segment), self._gz_path(segment)
+        with gzip.open(gz, "rb") as src, open(plain + ".tmp", "wb") as dst:
+            while True:
+                chunk = src.read(1 << 20)
+                if not chunk:
+                    break
+                dst.write(chunk)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(plain + ".tmp", plain)
+        os.remove(gz)
+        if self._gz_cache[0] == segment:
+            self._gz_cache = (None, None)
+
+    # ---------- чтение ----------
+    def _read_gz(self, segment):
+        # Последний распакованный сегмент держим в памяти: поиск часто идёт по одному месяцу
+        cached_segment, data = self._gz_cache
+        if cached_segment != segment:
+            with gzip.open(self._gz_path(segment), "rb") as f:
+                data = f.read()
+            self._gz_cache = (segment, data)
+        return data
+
+    def _read_entries(self, entries):
+        """Заказы по индексным записям: открытые сегменты — через mmap, закрытые — распаковкой."""
+        by_segment = {}
+        for entry in entries:
+            by_segment.setdefault(entry[3], []).append(entry)
+        kinds = self.segments()
+        orders = []
+        for segment, segment_entries in sorted(by_segment.items()):
+            kind = kinds.get(segment)
+            if kind == "gz":
+                data = self._read_gz(segment)
+                orders += [json.loads(data[e[4]:e[4] + e[5]]) for e in segment_entries]
+            elif kind is not None:
+                with open(self._plain_path(segment), "rb") as f, \
+                        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    orders += [json.loads(mapped[e[4]:e[4] + e[5]]) for e in segment_entries]
+        return orders
+
+    def iter_orders(self, segments=None):
+        """Потоково отдаёт заказы сегментов (по умолчанию всех) в порядке месяцев."""
+        with self._lock:
+            names = list(self.segments())
+        for segment in names:
+            if segments is not None and segment not in segments:
+                continue
+            # Вид сегмента проверяем и файл открываем под блокировкой: rotate в соседнем
+            # потоке не удалит его между проверкой и open, а открытый файл дочитается и после сжатия
+            with self._lock:
+                f = self._open_segment(segment)
+            if f is not None:
+                yield from self._iter_lines(f)
+
+    def _open_segment(self, segment):
+        # Если есть оба файла (сбой посреди сжатия), как и в segments(), верим сжатому
+        if os.path.exists(self._gz_path(segment)):
+            return gzip.open(self._gz_path(segment), "rb")
+        if os.path.exists(self._plain_path(segment)):
+            return open(self._plain_path(segment), "rb")
+        return None
+
+    @staticmethod
+    def _iter_lines(f):
+        with f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Недописанная строка после сбоя — пропускаем
+                    print("⚠️ Повреждённая строка в архиве пропущена")
+
+    def month(self, segment):
+        """Все заказы месяца "YYYY-MM"."""
+        return list(self.iter_orders({segment}))
+
+    def find(self, client=None, manager=None, date_from=None, date_to=None):
+        """
+        Заказы по клиенту, менеджеру и/или периоду (строки ISO, включительно).
+        Фильтр идёт по индексу, читаются только найденные заказы.
+        """
+        with self._lock:
+            entries = [
+                e for e in self._load_index()
+                if (client is None or e[1] == client)
+                and (manager is None or e[2] == manager)
+                and (date_from is None or e[0][:len(date_from)] >= date_from)
+                and (date_to is None or e[0][:len(date_to)] <= date_to)
+            ]
+            return self._read_entries(entries)
+
+    def count(self):
+        with self._lock:
+            return len(self._load_index())
+
+    # ---------- обслуживание ----------
+    def rotate(self, now=None):
+        """Сжимает сегменты закрытых месяцев (все, кроме текущего). Возвращает их список."""
+        current = (now or datetime.now()).strftime("%Y-%m")
+        rotated = []
+        with self._lock:
+            self._load_index()
+            for segment, kind in self.segments().items():
+                if kind != "plain" or segment >= current or segment == UNDATED:
+                    continue
+                self._compress(segment)
+                rotated.append(segment)
+        return rotated
+
+    def _compress(self, segment):
+        plain, gz = self._plain_path(segment), self._gz_path(segment)
+        tmp_file = gz + ".tmp"
+        with open(plain, "rb") as src, open(tmp_file, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as dst:
+                while True:
+                    chunk = src.read(1 << 20)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_file, gz)
+        os.remove(plain)
+        if self._gz_cache[0] == segment:
+            self._gz_cache = (None, None)
+
+    def compact(self, now=None):
+        """
+        Переписывает каждый сегмент без повреждённых строк, сжимает
+        закрытые месяцы и строит индекс заново.
+        """
+        current = (now or datetime.now()).strftime("%Y-%m")
+        with self._lock:
+            entries = []
+            for segment in self.segments():
+                lines = []
+                offset = 0
+                f = self._open_segment(segment)  # блокировка уже взята
+                for order in (self._iter_lines(f) if f is not None else ()):
+                    line = (json.dumps(order, ensure_ascii=False) + "\n").encode("utf-8")
+                    lines.append(line)
+                    entries.append(_index_entry(order, segment, offset, len(line)))
+                    offset += len(line)
+                data = b"".join(lines)
+                plain = self._plain_path(segment)
+                tmp_file = plain + ".tmp"
+                with open(tmp_file, "wb") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_file, plain)
+                if os.path.exists(self._gz_path(segment)):
+                    os.remove(self._gz_path(segment))
+                if segment < current and segment != UNDATED:
+                    self._compress(segment)
+            self._rewrite_index(entries)
+            self._gz_cache = (None, None)
+            return len(entries)
+
+    def stats(self):
+        kinds = self.segments()
+        sizes = {}
+        for segment, kind in kinds.items():
+            path = self._gz_path(segment) if kind == "gz" else self._plain_path(segment)
+            sizes[segment] = (kind, os.path.getsize(path))
+        return {"orders": self.count(), "segments": sizes}
+
+
+def read_archive_file(path):
+    """Заказы из старого архива: JSON-массив (orders_archive.json) или JSON Lines."""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".json"):
+            yield from json.load(f)
+            return
+        for line in f:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    print("⚠️ Повреждённая строка в архиве пропущена")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Обслуживание месячного архива заказов")
+    parser.add_argument("--dir", default=ARCHIVE_DIR)
+    parser.add_argument("command", choices=["stats", "rotate", "compact", "import"])
+    parser.add_argument("file", nargs="?", help="для import: orders_archive.json или .jsonl")
+    args = parser.parse_args()
+
+    archive = OrderArchive(args.dir)
+    if args.command == "rotate":
+        print("Сжаты месяцы:", ", ".join(archive.rotate()) or "нет")
+    elif args.command == "compact":
+        print(f"Архив пересобран: {archive.compact()} заказов")
+    elif args.command == "import":
+        if not args.file:
+            parser.error("import: укажите файл архива")
+        print(f"Импортировано заказов: {archive.import_orders(read_archive_file(args.file))}")
+    else:
+        stats = archive.stats()
+        print(f"Заказов: {stats['orders']}")
+        for segment, (kind, size) in stats["segments"].items():
+            print(f"  {segment:8} {kind:5} {size / 1024:10.1f} KiB")
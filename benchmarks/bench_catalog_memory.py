@@ -0,0 +1,143 @@
+"""
+Память каталога склада и стоимость расчёта суммы строки заказа на 100k строк:
+словари со строковыми ценами (как было) против записей Product со __slots__,
+ценами в центах и интернированными кодами. Сравниваются и сами записи,
+и весь ProductCatalog с индексами — то, что бот держит в памяти на самом деле.
+
+    python benchmarks/bench_catalog_memory.py [--rows 100000]
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import products
+from fakes import FakeWorksheet, STOCK_HEADER
+from prices import line_totals
+
+
+def stock_records(count):
+    """Записи листа как из get_all_records: цены с запятой, несколько сотен разных цен."""
+    ws = FakeWorksheet([STOCK_HEADER] + [
+        [f"4792252{i:06d}", f"T{i % 500}", f"green tea #{i}", i % 300, f"15.0{1 + i % 9}.2028",
+         f"{1 + i % 40},{i % 100:02d}", f"{2 + i % 40},{(i * 7) % 100:02d}"]
+        for i in range(count)
+    ])
+    return ws, ws.get_all_records()
+
+
+def legacy_row_to_product(row):
+    # Прежний формат каталога: словарь на строку, цены — строки
+    return {
+        "code": str(row.get("Код", "")).strip(),
+        "extra_code": str(row.get("Товар", "")).strip(),
+        "name": row.get("Наименование", ""),
+        "stock": row.get("Остаток", 0),
+        "expiry": row.get("Срок годности", ""),
+        "price_no_vat": str(row.get("Цена без НДС", "")).replace(",", "."),
+        "price_with_vat": str(row.get("Цена с НДС", "")).replace(",", "."),
+    }
+
+
+class LegacyRecord(dict):
+    """Запись каталога до Product: словарь со строковыми ценами; атрибуты — для индексов ProductCatalog."""
+
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+def legacy_catalog(ws):
+    """ProductCatalog, в котором строки склада — словари, как до перехода на Product."""
+    catalog = products.ProductCatalog(lambda: ws)
+    row_to_product = products._row_to_product
+    products._row_to_product = lambda row: LegacyRecord(legacy_row_to_product(row))
+    try:
+        catalog.refresh()
+    finally:
+        products._row_to_product = row_to_product
+    return catalog
+
+
+def compact_catalog(ws):
+    catalog = products.ProductCatalog(lambda: ws)
+    catalog.refresh()
+    return catalog
+
+
+def measure(build):
+    """(результат, байт памяти) для build()."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def best_of(func, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    ws, records = stock_records(args.rows)
+    legacy, legacy_bytes = measure(lambda: {p["code"]: p for p in map(legacy_row_to_product, records)})
+    compact, compact_bytes = measure(lambda: {p.code: p for p in map(products._row_to_product, records)})
+    del legacy, compact
+    legacy, legacy_catalog_bytes = measure(lambda: legacy_catalog(ws))
+    del legacy
+    catalog, catalog_bytes = measure(lambda: compact_catalog(ws))
+    # Время — отдельно, без tracemalloc (он замедляет аллокации в разы)
+    legacy_build = best_of(lambda: [legacy_row_to_product(row) for row in records], 3)
+    compact_build = best_of(lambda: [products._row_to_product(row) for row in records], 3)
+    legacy_catalog_build = best_of(lambda: legacy_catalog(ws), 3)
+    compact_catalog_build = best_of(lambda: compact_catalog(ws), 3)
+
+    print(f"строк склада: {args.rows}")
+    print(f"записи, словари со строками цен: {legacy_bytes / 2**20:7.1f} MiB, разбор {legacy_build * 1000:7.1f} ms")
+    print(f"записи Product (__slots__):      {compact_bytes / 2**20:7.1f} MiB, разбор {compact_build * 1000:7.1f} ms"
+          f"  ({compact_bytes / legacy_bytes:.0%} памяти)")
+    print(f"каталог с индексами, словари:    {legacy_catalog_bytes / 2**20:7.1f} MiB, "
+          f"сборка {legacy_catalog_build * 1000:7.1f} ms")
+    print(f"каталог с индексами, Product:    {catalog_bytes / 2**20:7.1f} MiB, "
+          f"сборка {compact_catalog_build * 1000:7.1f} ms  ({catalog_bytes / legacy_catalog_bytes:.0%} памяти)")
+
+    # Суммы строк заказа, как в handle_product_qty: каждая строка с количеством 1..30
+    legacy_items = [legacy_row_to_product(row) for row in records[:10_000]]
+    compact_items = [p.as_dict() for p in list(catalog._rows.values())[:10_000]]
+
+    def legacy_totals():
+        for i, p in enumerate(legacy_items):
+            qty = 1 + i % 30
+            round(float(p["price_no_vat"]) * qty, 2), round(float(p["price_with_vat"]) * qty, 2)
+
+    def compact_totals():
+        for i, p in enumerate(compact_items):
+            line_totals(p, 1 + i % 30)
+
+    before = best_of(legacy_totals) / len(legacy_items)
+    after = best_of(compact_totals) / len(compact_items)
+    print(f"сумма строки: float(строка) {before * 1e9:6.0f} ns, центы {after * 1e9:6.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
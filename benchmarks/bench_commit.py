@@ -0,0 +1,99 @@
+"""
+Подтверждений заказов в секунду при 1, 10 и 100 одновременных менеджерах:
+"inline" — как раньше, каждый обработчик сам пишет архив (confirm_order),
+"pipeline" — обработчики ждут OrderCommitPipeline, который пишет пачками.
+Архив и черновики — во временной папке (--dir — на нужном диске: на tmpfs fsync ничего не стоит).
+
+    python benchmarks/bench_commit.py [--backend json|sqlite] [--confirms 20] [--dir .]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--backend", choices=("json", "sqlite"), default="json")
+parser.add_argument("--confirms", type=int, default=20, help="подтверждений на менеджера")
+parser.add_argument("--dir", help="где создать временную папку")
+args = parser.parse_args()
+
+TMP = tempfile.mkdtemp(dir=args.dir)
+os.environ.update({
+    "EMAIL_SENDER": "bot@example.com",
+    "EMAIL_PASSWORD": "secret",
+    "EMAIL_RECIPIENT": "accountant@example.com",
+    "ORDERS_BACKEND": args.backend,
+    "REPORTS_FILE": os.path.join(TMP, "sales_rollups.json"),
+})
+
+import orders
+from bench_pdf import make_order
+from order_commit import OrderCommitPipeline
+
+orders.ARCHIVE_FILE = os.path.join(TMP, "missing.jsonl")
+orders.LEGACY_ARCHIVE_FILE = os.path.join(TMP, "missing.json")
+
+
+def reset_storage(run_dir, users):
+    """Пустой архив и черновики всех менеджеров, как перед подтверждением."""
+    os.makedirs(run_dir)
+    orders.ARCHIVE_DIR = os.path.join(run_dir, "archive")
+    orders.ORDERS_FILE = os.path.join(run_dir, "orders_data.json")
+    orders.ORDERS_DB = os.path.join(run_dir, "orders.db")
+    orders._order_archive = None
+    orders._order_store = None
+    orders.save_orders({str(user_id): make_order(5) for user_id in range(users)})
+
+
+async def run(mode, users, confirms):
+    order = make_order(5)
+    pipeline = OrderCommitPipeline(orders.archive_confirmed, on_commit=orders.record_sales)
+    if mode == "pipeline":
+        pipeline.start()
+
+    async def manager(user_id):
+        for _ in range(confirms):
+            if mode == "pipeline":
+                await pipeline.submit(user_id, order)
+            else:
+                orders.confirm_order(user_id, order)
+            await asyncio.sleep(0)  # следующий апдейт менеджера
+
+    start = time.perf_counter()
+    await asyncio.gather(*[manager(user_id) for user_id in range(users)])
+    elapsed = time.perf_counter() - start
+    await pipeline.stop()
+    return elapsed, pipeline.stats()
+
+
+def count_archived():
+    return sum(1 for _ in orders.iter_orders_archive())
+
+
+def main():
+    print(f"хранилище {args.backend}, {args.confirms} подтверждений на менеджера")
+    for users in (1, 10, 100):
+        line = [f"менеджеров {users:3}:"]
+        for mode in ("inline", "pipeline"):
+            run_dir = os.path.join(TMP, f"{mode}_{users}")
+            reset_storage(run_dir, users)
+            elapsed, stats = asyncio.run(run(mode, users, args.confirms))
+            total = users * args.confirms
+            assert count_archived() == total, (count_archived(), total)
+            line.append(f"{mode} {total / elapsed:8.1f} подтв./с")
+            if mode == "pipeline":
+                line.append(f"(пачек {stats['batches']}, до {stats['max_batch']} в пачке)")
+            shutil.rmtree(run_dir)
+        print("  ".join(line))
+    shutil.rmtree(TMP)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Сравнение накладных расходов FSM-хранилищ на одно обновление сессии:
+MemoryStorage против SQLiteStorage (fsm_storage.py).
+
+    python benchmarks/bench_fsm_storage.py [--updates 20000] [--users 50]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from fsm_storage import SQLiteStorage
+
+PRODUCT = {
+    "code": "4711137550011", "extra_code": "", "name": "JUSTMAKE Tung Ding Oolong Tea 100g",
+    "stock": 56, "expiry": "05.01.2028", "price_no_vat": "5.33", "price_with_vat": "6.45",
+}
+
+
+async def run(storage, updates, users):
+    keys = [StorageKey(bot_id=1, chat_id=uid, user_id=uid) for uid in range(users)]
+    start = time.perf_counter()
+    for i in range(updates):
+        key = keys[i % users]
+        await storage.set_state(key, "OrderState:product_qty")
+        await storage.update_data(key, {"product": PRODUCT, "step": i})
+        await storage.get_data(key)
+    elapsed = time.perf_counter() - start
+    close_start = time.perf_counter()
+    await storage.close()
+    return elapsed, time.perf_counter() - close_start
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, storage in (
+            ("MemoryStorage", MemoryStorage()),
+            ("SQLiteStorage", SQLiteStorage(os.path.join(tmp, "fsm.db"), flush_interval=0.05)),
+        ):
+            elapsed, close_time = await run(storage, args.updates, args.users)
+            print(f"{name:14} {elapsed / args.updates * 1e6:8.2f} µs/обновление, close {close_time * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
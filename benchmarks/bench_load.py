@@ -0,0 +1,202 @@
+"""
+Нагрузочный прогон всего сценария заказа без Telegram, Google и почты.
+N менеджеров параллельно проходят OrderState от имени менеджера до
+подтверждения: апдейты идут в dp.feed_update, Bot API отвечает FakeSession,
+склад и TempOrders — листы в памяти (FakeWorksheet), письма уходят
+на локальный FakeSMTPServer. Состав заказов (клиенты, товары, количества,
+примечания, адреса) берётся из orders_archive.json.
+
+    python benchmarks/bench_load.py [--managers 50] [--orders 2] [--seed 1]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+
+TMP = tempfile.mkdtemp()
+os.environ.update({
+    "BOT_TOKEN": "123456:TEST-TOKEN",
+    "EMAIL_SENDER": "bot@example.com",
+    "EMAIL_PASSWORD": "secret",
+    "EMAIL_RECIPIENT": "accountant@example.com",
+    "RUN_MODE": "polling",
+    "TEMP_ORDERS_SYNC": "1",
+    "TEMP_ORDERS_SYNC_INTERVAL": "0.5",
+    "FSM_DB": os.path.join(TMP, "fsm.db"),
+    "REPORTS_FILE": os.path.join(TMP, "sales_rollups.json"),
+    "ARCHIVE_DIR": os.path.join(TMP, "orders_archive"),
+})
+
+from aiogram import types
+
+import main
+import metrics
+import orders
+import products
+import sheets
+from email_transport import SMTPPool
+from fakes import STOCK_HEADER, FakeSession, FakeSMTPServer, FakeWorksheet
+
+orders.ARCHIVE_FILE = os.path.join(TMP, "missing.jsonl")
+orders.LEGACY_ARCHIVE_FILE = os.path.join(TMP, "missing.json")
+orders.ORDERS_FILE = os.path.join(TMP, "orders_data.json")
+
+
+def load_archive(path=os.path.join(ROOT, "orders_archive.json")):
+    with open(path, "r", encoding="utf-8") as f:
+        return [order for order in json.load(f) if order.get("products")]
+
+
+def stock_sheet(archive):
+    """
+    Лист склада из всех товаров, которые встречались в архиве.
+    Остаток с запасом: менеджеры заказывают одно и то же, и резервы не должны отказывать.
+    """
+    rows = {}
+    for order in archive:
+        for p in order["products"]:
+            rows[p["code"]] = [
+                p["code"], p.get("extra_code", ""), p["name"], 1_000_000,
+                p.get("expiry", ""), p.get("price_no_vat", ""), p.get("price_with_vat", ""),
+            ]
+    return FakeWorksheet([STOCK_HEADER] + list(rows.values()))
+
+
+def make_script(order, manager):
+    """Шаги одного заказа: ("msg", текст) или ("cb", callback_data) / ("product", код)."""
+    steps = [("msg", "/start"), ("msg", manager), ("msg", order.get("client") or "Клиент")]
+    for p in order["products"]:
+        steps.append(("product", p["code"]))
+        steps.append(("cb", "add_product"))
+        steps.append(("msg", str(p.get("qty") or 1)))
+    steps += [
+        ("msg", "Готово"),
+        ("msg", order.get("note") or "-"),
+        ("msg", order.get("delivery_date") or "01.01"),
+        ("msg", order.get("delivery_address") or "Riga"),
+        ("cb", "confirm_order"),
+    ]
+    return steps
+
+
+class Driver:
+    def __init__(self, session):
+        self.session = session
+        self.update_id = 0
+        self.latencies = []
+
+    def _user(self, user_id):
+        return {"id": user_id, "is_bot": False, "first_name": "Manager"}
+
+    async def feed(self, user_id, text=None, callback_data=None):
+        self.update_id += 1
+        chat = {"id": user_id, "type": "private"}
+        if callback_data is None:
+            payload = {"message": {
+                "message_id": self.update_id, "date": int(time.time()),
+                "chat": chat, "from": self._user(user_id), "text": text,
+            }}
+        else:
+            payload = {"callback_query": {
+                "id": str(self.update_id), "from": self._user(user_id), "chat_instance": "load",
+                "data": callback_data,
+                "message": {"message_id": self.update_id, "date": int(time.time()), "chat": chat, "text": "…"},
+            }}
+        update = types.Update(update_id=self.update_id, **payload)
+        start = time.perf_counter()
+        await main.dp.feed_update(main.bot, update)
+        self.latencies.append(time.perf_counter() - start)
+
+    def last_reply(self, user_id):
+        for name, method in reversed(self.session.calls):
+            if name == "sendMessage" and method.chat_id == user_id:
+                return method
+        raise AssertionError(f"нет ответа пользователю {user_id}")
+
+    async def run_script(self, user_id, steps):
+        for kind, value in steps:
+            if kind == "msg":
+                await self.feed(user_id, text=value)
+            elif kind == "cb":
+                await self.feed(user_id, callback_data=value)
+            else:
+                await self.feed(user_id, text=value[-4:])
+                reply = self.last_reply(user_id)
+                if reply.text.startswith("Найдено несколько"):
+                    # Несколько товаров с теми же 4 цифрами — жмём кнопку нужного кода
+                    button = next(
+                        row[0] for row in reply.reply_markup.inline_keyboard
+                        if f"код {value})" in row[0].text
+                    )
+                    await self.feed(user_id, callback_data=button.callback_data)
+        assert self.last_reply(user_id).text.startswith("✅ Заказ отправлен"), self.last_reply(user_id).text
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def run(managers, orders_per_manager, seed):
+    archive = load_archive()
+    rng = random.Random(seed)
+    scripts = {
+        100000 + i: [make_script(rng.choice(archive), f"Manager{i}") for _ in range(orders_per_manager)]
+        for i in range(managers)
+    }
+
+    session = FakeSession()
+    main.bot.session = session
+    products.catalog._get_worksheet = lambda ws=stock_sheet(archive): ws
+    sheets._temp_orders_ws = FakeWorksheet([sheets.TEMP_ORDERS_HEADER])
+    smtp_server = await FakeSMTPServer().start()
+    orders._smtp_pool = SMTPPool("bot@example.com", "secret", hostname="127.0.0.1",
+                                 port=smtp_server.port, use_tls=False)
+
+    driver = Driver(session)
+    await main.dp.emit_startup(bot=main.bot)
+
+    async def manager(user_id):
+        for steps in scripts[user_id]:
+            await driver.run_script(user_id, steps)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[manager(user_id) for user_id in scripts])
+    elapsed = time.perf_counter() - start
+
+    await main.dp.emit_shutdown(bot=main.bot)
+    await main.storage.close()
+    await smtp_server.stop()
+
+    confirmed = managers * orders_per_manager
+    archived = sum(1 for _ in orders.iter_orders_archive())
+    assert archived == confirmed, (archived, confirmed)
+    assert len(smtp_server.messages) == confirmed, (len(smtp_server.messages), confirmed)
+
+    latencies = sorted(driver.latencies)
+    print(f"менеджеров {managers}, заказов {confirmed}, апдейтов {len(latencies)} за {elapsed:.2f} s")
+    print(f"пропускная способность: {len(latencies) / elapsed:8.1f} апдейтов/с")
+    print(f"задержка обработчика:   p50 {percentile(latencies, 0.5) * 1000:6.2f} ms, "
+          f"p99 {percentile(latencies, 0.99) * 1000:6.2f} ms, max {latencies[-1] * 1000:6.2f} ms")
+    print(f"писем {len(smtp_server.messages)}, запросов к TempOrders {sheets._temp_orders_ws.requests}")
+    print("по шагам сценария:")
+    for line in metrics.summary_lines():
+        if line.startswith("handler_seconds"):
+            print("  " + line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--managers", type=int, default=50)
+    parser.add_argument("--orders", type=int, default=2, help="заказов на менеджера")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(run(args.managers, args.orders, args.seed))
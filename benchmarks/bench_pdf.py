@@ -0,0 +1,67 @@
+"""
+Скорость и аллокации сборки PDF заказа (email_module.render_pdf)
+для заказов на 5, 50 и 500 строк.
+
+    python benchmarks/bench_pdf.py [--repeat 20]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)  # DejaVuSans.ttf ищется относительно рабочей папки
+
+from email_module import render_pdf
+
+
+def make_order(lines):
+    return {
+        "manager": "Nikita",
+        "client": "SIA Maxima",
+        "delivery_date": "28.08",
+        "delivery_address": "Brivibas iela 120, Riga",
+        "note": "Бенчмарк",
+        "products": [
+            {
+                "code": f"47111375{i:05d}",
+                "extra_code": "",
+                "name": f"JUSTMAKE Tung Ding Oolong Tea 100g #{i}",
+                "qty": 1 + i % 30,
+                "price_no_vat": "5.33",
+                "price_with_vat": "6.45",
+            }
+            for i in range(lines)
+        ],
+    }
+
+
+def bench(lines, repeat):
+    order = make_order(lines)
+    render_pdf(order)  # прогрев: шрифт, кэши reportlab
+    start = time.perf_counter()
+    for _ in range(repeat):
+        size = len(render_pdf(order))
+    ms = (time.perf_counter() - start) / repeat * 1000
+
+    tracemalloc.start()
+    render_pdf(order)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return ms, peak, size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    for lines in (5, 50, 500):
+        repeat = max(1, args.repeat // (10 if lines >= 500 else 1))
+        ms, peak, size = bench(lines, repeat)
+        print(f"{lines:4} строк: {ms:8.2f} ms/заказ, пик аллокаций {peak / 1024:8.1f} KiB, PDF {size / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
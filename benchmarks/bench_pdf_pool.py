@@ -0,0 +1,70 @@
+"""
+Нагрузочный тест рендера PDF: 50 заказов рендерятся одновременно,
+а параллельно меряется задержка event loop (насколько опаздывает тик
+asyncio.sleep). Сравниваются рендер в потоках и в пуле процессов.
+
+    python benchmarks/bench_pdf_pool.py [--orders 50] [--lines 50] [--workers 4]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+
+import email_module
+from bench_pdf import make_order
+
+TICK = 0.005
+
+
+async def probe_loop_lag(stop, lags):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+
+async def run(orders, lines):
+    lags = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(probe_loop_lag(stop, lags))
+    await asyncio.sleep(0.1)
+    baseline = len(lags)
+    start = time.perf_counter()
+    await asyncio.gather(*[email_module.render_pdf_async(make_order(lines)) for _ in range(orders)])
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe
+    under_load = sorted(lags[baseline:]) or [0.0]
+    p99 = under_load[min(len(under_load) - 1, int(len(under_load) * 0.99))]
+    return elapsed, statistics.median(under_load), p99, under_load[-1]
+
+
+def report(name, elapsed, p50, p99, worst):
+    print(f"{name:16} всего {elapsed:6.2f} s | задержка loop p50 {p50 * 1000:6.2f} ms, "
+          f"p99 {p99 * 1000:7.2f} ms, max {worst * 1000:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=50)
+    parser.add_argument("--lines", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    args = parser.parse_args()
+
+    report("потоки", *asyncio.run(run(args.orders, args.lines)))
+    email_module.start_pdf_pool(args.workers)
+    try:
+        report(f"процессы x{args.workers}", *asyncio.run(run(args.orders, args.lines)))
+    finally:
+        email_module.shutdown_pdf_pool()
+
+
+if __name__ == "__main__":
+    main()
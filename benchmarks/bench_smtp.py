@@ -0,0 +1,66 @@
+"""
+Отправка писем на локальный SMTP-сервер (benchmarks/fakes.py):
+новое соединение на каждое письмо, как в send_email_with_pdf,
+против пула сессий email_transport.SMTPPool. Сервер периодически
+рвёт соединение, чтобы пул проходил через переподключение.
+
+    python benchmarks/bench_smtp.py [--messages 200] [--drop-after 50]
+"""
+import argparse
+import asyncio
+import os
+import smtplib
+import sys
+import time
+from email.message import EmailMessage
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from email_transport import SMTPPool
+from fakes import FakeSMTPServer
+
+
+def make_message(i):
+    msg = EmailMessage()
+    msg["Subject"] = f"Новый заказ #{i}"
+    msg["From"] = "bot@example.com"
+    msg["To"] = "accountant@example.com"
+    msg.set_content("Новый заказ!")
+    msg.add_attachment(b"%PDF-1.4 fake" * 2000, maintype="application", subtype="pdf", filename="order.pdf")
+    return msg
+
+
+def send_one_per_connection(port, messages):
+    for i in range(messages):
+        with smtplib.SMTP("127.0.0.1", port) as smtp:
+            smtp.login("bot@example.com", "secret")
+            smtp.send_message(make_message(i))
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--drop-after", type=int, default=50)
+    args = parser.parse_args()
+
+    server = await FakeSMTPServer().start()
+    start = time.perf_counter()
+    await asyncio.to_thread(send_one_per_connection, server.port, args.messages)
+    elapsed = time.perf_counter() - start
+    print(f"соединение на письмо: {args.messages / elapsed:8.1f} писем/с, соединений {server.connections}")
+    await server.stop()
+
+    server = await FakeSMTPServer(drop_after=args.drop_after).start()
+    pool = SMTPPool("bot@example.com", "secret", hostname="127.0.0.1", port=server.port, use_tls=False, size=2)
+    start = time.perf_counter()
+    await asyncio.gather(*[pool.send(make_message(i)) for i in range(args.messages)])
+    elapsed = time.perf_counter() - start
+    await pool.close()
+    await server.stop()
+    assert len(server.messages) == args.messages, (len(server.messages), args.messages)
+    print(f"пул SMTP-сессий:     {args.messages / elapsed:8.1f} писем/с, соединений {server.connections}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+"""
+Время импорта бота: запускает `python -X importtime -c "import main"`
+в отдельном процессе с запрещённой сетью и показывает самые тяжёлые модули.
+Импорт main не должен ходить в сеть, писать файлы или разбирать шрифт.
+
+    python benchmarks/bench_startup.py [--top 15] [--module main]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Любая попытка открыть соединение при импорте — ошибка
+NO_NETWORK = (
+    "import socket\n"
+    "def _blocked(*args, **kwargs):\n"
+    "    raise RuntimeError('network access during import')\n"
+    "socket.socket.connect = _blocked\n"
+    "socket.create_connection = _blocked\n"
+    "import {module}\n"
+)
+
+DUMMY_ENV = {
+    "BOT_TOKEN": "123456:TEST-TOKEN",
+    "EMAIL_SENDER": "bot@example.com",
+    "EMAIL_PASSWORD": "secret",
+    "EMAIL_RECIPIENT": "accountant@example.com",
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    for key, value in DUMMY_ENV.items():
+        env.setdefault(key, value)
+
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", NO_NETWORK.format(module=args.module)],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - start
+
+    timings = []
+    errors = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            errors.append(line)
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        timings.append((int(parts[1]), parts[2].rstrip()))
+
+    if result.returncode != 0:
+        print("\n".join(errors))
+        sys.exit(f"❌ import {args.module} завершился с ошибкой")
+
+    print(f"import {args.module}: {wall * 1000:.0f} ms (весь процесс), сеть при импорте не использовалась")
+    print(f"{'кумулятивно, ms':>16}  модуль")
+    for cumulative, name in sorted(timings, reverse=True)[:args.top]:
+        print(f"{cumulative / 1000:16.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Задержка режима вебхука без Telegram: поднимает aiohttp-приложение
+main.create_webhook_app() на локальном порту, шлёт синтетические апдейты
+(/start и имя менеджера) и меряет, как быстро отвечает POST и как быстро
+обработчик отправляет ответ. Корректность проверяет tests/test_webhook.py.
+
+    python benchmarks/bench_webhook.py [--updates 200]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+
+TMP = tempfile.mkdtemp()
+os.environ.update({
+    "BOT_TOKEN": "123456:TEST-TOKEN",
+    "EMAIL_SENDER": "bot@example.com",
+    "EMAIL_PASSWORD": "secret",
+    "EMAIL_RECIPIENT": "accountant@example.com",
+    "RUN_MODE": "webhook",
+    "WEBHOOK_BASE_URL": "https://bot.example.com",
+    "WEBHOOK_SECRET": "local-secret",
+    "TEMP_ORDERS_SYNC": "0",
+    "FSM_DB": os.path.join(TMP, "fsm.db"),
+    "REPORTS_FILE": os.path.join(TMP, "sales_rollups.json"),
+    "ARCHIVE_DIR": os.path.join(TMP, "orders_archive"),
+})
+
+from aiohttp.test_utils import TestClient, TestServer
+
+import main
+import orders
+from fakes import FakeSession
+
+orders.ORDERS_FILE = os.path.join(TMP, "orders_data.json")
+
+
+def message_update(update_id, user_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Manager"},
+            "text": text,
+        },
+    }
+
+
+async def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("обработчик не ответил вовремя")
+        await asyncio.sleep(0.001)
+
+
+async def run(updates):
+    session = FakeSession()
+    main.bot.session = session
+    headers = {"X-Telegram-Bot-Api-Secret-Token": main.WEBHOOK_SECRET}
+
+    async with TestClient(TestServer(main.create_webhook_app())) as client:
+        post_times, reply_times = [], []
+        for i in range(updates):
+            user_id = 1000 + i
+            for text in ("/start", "Nikita"):
+                before = len(session.sent_texts(user_id))
+                start = time.perf_counter()
+                resp = await client.post(main.WEBHOOK_PATH, json=message_update(i * 2 + 2, user_id, text), headers=headers)
+                post_times.append(time.perf_counter() - start)
+                resp.raise_for_status()
+                await wait_for(lambda: len(session.sent_texts(user_id)) > before)
+                reply_times.append(time.perf_counter() - start)
+
+    post_times.sort()
+    reply_times.sort()
+    p99 = lambda values: values[min(len(values) - 1, int(len(values) * 0.99))]
+    print(f"апдейтов: {len(post_times)}")
+    print(f"ответ на POST:      p50 {post_times[len(post_times) // 2] * 1000:6.2f} ms, p99 {p99(post_times) * 1000:6.2f} ms")
+    print(f"ответ обработчика:  p50 {reply_times[len(reply_times) // 2] * 1000:6.2f} ms, p99 {p99(reply_times) * 1000:6.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=200)
+    asyncio.run(run(parser.parse_args().updates))
@@ -0,0 +1,182 @@
+"""Локальные заглушки внешних сервисов для бенчмарков."""
+import asyncio
+from datetime import datetime
+
+from aiogram import types
+from aiogram.client.session.base import BaseSession
+
+
+class FakeSMTPServer:
+    """
+    Минимальный SMTP-сервер на asyncio: принимает AUTH PLAIN, MAIL/RCPT/DATA
+    и складывает письма в self.messages. drop_after=N рвёт соединение
+    после N писем — так проверяется переподключение клиента.
+    drop_in_data=True принимает текст письма и рвёт соединение, не ответив на DATA.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, drop_after=None, drop_in_data=False):
+        self.host = host
+        self.port = port
+        self.drop_after = drop_after
+        self.drop_in_data = drop_in_data
+        self.messages = []
+        self.connections = 0
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        sent_here = 0
+
+        def reply(line):
+            writer.write(line.encode() + b"\r\n")
+
+        reply("220 fake ESMTP")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode(errors="replace").strip()
+                verb = command.split(" ", 1)[0].upper()
+                if verb in ("EHLO", "HELO"):
+                    reply("250-fake")
+                    reply("250-AUTH PLAIN")
+                    reply("250-8BITMIME")
+                    reply("250-SMTPUTF8")
+                    reply("250 SIZE 52428800")
+                elif verb == "AUTH":
+                    reply("235 2.7.0 Authentication successful")
+                elif verb in ("MAIL", "RCPT", "RSET", "NOOP"):
+                    reply("250 OK")
+                elif verb == "DATA":
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    await writer.drain()
+                    data = await reader.readuntil(b"\r\n.\r\n")
+                    self.messages.append(data)
+                    sent_here += 1
+                    if self.drop_in_data:
+                        break
+                    reply("250 OK queued")
+                    if self.drop_after and sent_here >= self.drop_after:
+                        await writer.drain()
+                        break
+                elif verb == "QUIT":
+                    reply("221 Bye")
+                    await writer.drain()
+                    break
+                else:
+                    reply("502 Command not implemented")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+class FakeSession(BaseSession):
+    """
+    Сессия aiogram без сети: запоминает вызовы Bot API в self.calls
+    и отвечает правдоподобными результатами. latency — имитация задержки Telegram.
+    """
+
+    def __init__(self, latency=0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls = []
+        self._message_id = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls.append((method.__api_method__, method))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        returning = getattr(method, "__returning__", None)
+        if returning is types.Message:
+            self._message_id += 1
+            return types.Message(
+                message_id=self._message_id,
+                date=datetime.now(),
+                chat=types.Chat(id=getattr(method, "chat_id", 0) or 0, type="private"),
+                text=getattr(method, "text", None),
+            )
+        if returning is types.User:
+            return types.User(id=1, is_bot=True, first_name="AlanikaBot")
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+    def sent_texts(self, chat_id=None):
+        return [
+            method.text for name, method in self.calls
+            if name == "sendMessage" and (chat_id is None or method.chat_id == chat_id)
+        ]
+
+
+# Шапка листа склада stock1 (колонки, которые читает products._row_to_product)
+STOCK_HEADER = ["Код", "Товар", "Наименование", "Остаток", "Срок годности", "Цена без НДС", "Цена с НДС"]
+
+
+class FakeWorksheet:
+    """
+    Лист gspread в памяти: values — строки листа, первая строка — шапка.
+    Поддерживает то, чем пользуются products.py и sheets.py.
+    """
+
+    def __init__(self, values=None):
+        self.values = [list(row) for row in (values or [])]
+        self.requests = 0
+
+    def get_all_records(self):
+        self.requests += 1
+        header, *rows = self.values or [[]]
+        return [dict(zip(header, row)) for row in rows]
+
+    def get_all_values(self):
+        # Как gspread: значения ячеек приходят строками
+        self.requests += 1
+        return [[str(cell) for cell in row] for row in self.values]
+
+    def col_values(self, col):
+        self.requests += 1
+        return [row[col - 1] if len(row) >= col else "" for row in self.values]
+
+    def batch_get(self, ranges):
+        self.requests += 1
+        blocks = []
+        for cell_range in ranges:
+            start, end = cell_range.split(":")
+            blocks.append([[str(cell) for cell in row] for row in self.values[int(start[1:]) - 1:int(end[1:])]])
+        return blocks
+
+    def _write(self, values, range_name):
+        start = int(range_name.split(":")[0][1:])
+        for offset, row in enumerate(values):
+            index = start - 1 + offset
+            while len(self.values) <= index:
+                self.values.append([])
+            self.values[index] = list(row)
+
+    def update(self, values, range_name="A1"):
+        self.requests += 1
+        self._write(values, range_name)
+
+    def batch_update(self, data):
+        self.requests += 1
+        for item in data:
+            self._write(item["values"], item["range"])
+
+    def delete_rows(self, start, end=None):
+        self.requests += 1
+        del self.values[start - 1:(end or start)]
@@ -0,0 +1,248 @@
+"""
+Набор микробенчмарков горячих путей заказа, без сети:
+поиск товара по окончанию кода (1k/10k/100k строк склада),
+поиск по части названия (50k строк),
+запись и чтение архива (100/10k/100k заказов), generate_pdf
+текст предпросмотра заказа (5/50/200 строк) и /report за год по дневным итогам.
+
+Результаты (секунды на операцию, лучший из повторов) пишутся в JSON.
+С --baseline прогон сравнивается с сохранённым и завершается с кодом 1,
+если какой-то случай стал медленнее больше чем на --threshold (20%).
+
+    python benchmarks/suite.py [--save benchmarks/results.json]
+    python benchmarks/suite.py --baseline benchmarks/results.json [--only archive]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)  # DejaVuSans.ttf ищется относительно рабочей папки
+
+TMP = tempfile.mkdtemp()
+os.environ.update({
+    "BOT_TOKEN": "123456:TEST-TOKEN",
+    "EMAIL_SENDER": "bot@example.com",
+    "EMAIL_PASSWORD": "secret",
+    "EMAIL_RECIPIENT": "accountant@example.com",
+    "ORDERS_BACKEND": "json",
+    "FSM_DB": os.path.join(TMP, "fsm.db"),
+    "REPORTS_FILE": os.path.join(TMP, "sales_rollups.json"),
+    "ARCHIVE_DIR": os.path.join(TMP, "orders_archive"),
+})
+
+import main
+import orders
+import products
+from bench_pdf import make_order
+from email_module import generate_pdf
+from fakes import STOCK_HEADER, FakeWorksheet
+from reports import SalesReports
+
+orders.ARCHIVE_FILE = os.path.join(TMP, "missing.jsonl")
+orders.LEGACY_ARCHIVE_FILE = os.path.join(TMP, "missing.json")
+
+
+def best_of(func, repeat, number=1):
+    """Лучшее время одного вызова func из repeat серий по number вызовов."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def stock_rows(count):
+    return [STOCK_HEADER] + [
+        [f"4792252{i:06d}", f"T{i % 500}", f"green tea #{i}", 100, "15.02.2028", "4.25", "5.14"]
+        for i in range(count)
+    ]
+
+
+def bench_find_product(results, repeat):
+    for rows in (1_000, 10_000, 100_000):
+        products.catalog = products.ProductCatalog(lambda ws=FakeWorksheet(stock_rows(rows)): ws)
+        products.catalog.refresh()
+        codes = [f"{i % 10000:04d}" for i in range(0, rows, max(1, rows // 100))]
+        results[f"find_product_by_code_ending[{rows}]"] = best_of(
+            lambda: [products.find_product_by_code_ending(code) for code in codes], repeat, number=50
+        ) / len(codes)
+
+
+SEARCH_QUERIES = ("oolong", "milk oolo", "зеленый чай", "jasmine 100g", "2933552", "T12", "soursop")
+
+
+def search_rows(count):
+    """Склад с названиями из словаря в несколько сотен слов, как у реального ассортимента."""
+    rng = random.Random(1)
+    syllables = ["ka", "mo", "ri", "ta", "lu", "sen", "cha", "bo", "ni", "pu", "er", "do", "lin", "ma", "so", "ya"]
+    vocab = sorted({"".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))) for _ in range(600)})
+    vocab += ["green", "black", "tea", "oolong", "milk", "jasmine", "soursop", "зеленый", "чай", "улун"]
+    sizes = ["50g", "100g", "250g", "20 bags", "1kg"]
+    return [STOCK_HEADER] + [
+        [f"4792252{i:06d}", f"T{i % 700}",
+         " ".join(rng.choice(vocab) for _ in range(rng.randint(2, 5))) + " " + rng.choice(sizes),
+         100, "15.02.2028", "4.25", "5.14"]
+        for i in range(count)
+    ]
+
+
+def bench_search(results, repeat):
+    catalog = products.ProductCatalog(lambda ws=FakeWorksheet(search_rows(50_000)): ws)
+    catalog.refresh()
+    for query in SEARCH_QUERIES:
+        results[f"find_by_name[50000:{query}]"] = best_of(lambda: catalog.find_by_name(query), repeat, number=50)
+
+
+def fill_archive(directory, count):
+    """Архив из count заказов, разложенных по 12 месяцам, 20 клиентов."""
+    orders.ARCHIVE_DIR = directory
+    orders._order_archive = None
+    start = datetime(2025, 1, 1)
+    archived = (
+        dict(make_order(3), client=f"Client {i % 20}",
+             timestamp=(start + timedelta(days=i * 365 // count)).isoformat())
+        for i in range(count)
+    )
+    orders.get_order_archive().import_orders(archived)
+    orders.get_order_archive().rotate(now=datetime(2025, 12, 15))
+    orders._order_archive = None  # следующие замеры читают индекс с диска
+
+
+def bench_archive(results, repeat):
+    order = make_order(3)
+    for count in (100, 10_000, 100_000):
+        directory = os.path.join(TMP, f"archive_{count}")
+        fill_archive(directory, count)
+        results[f"write_order_to_archive[{count}]"] = best_of(
+            lambda: orders.write_order_to_archive(order), repeat, number=20
+        )
+        results[f"load_orders_archive[{count}]"] = best_of(
+            orders.load_orders_archive, max(1, repeat // (10 if count >= 100_000 else 1))
+        )
+        results[f"find_archived_orders[{count}:month]"] = best_of(
+            lambda: orders.find_archived_orders(date_from="2025-06", date_to="2025-06"), repeat
+        )
+        results[f"find_archived_orders[{count}:client]"] = best_of(
+            lambda: orders.find_archived_orders(client="Client 7", date_from="2025-06", date_to="2025-06"), repeat
+        )
+        shutil.rmtree(directory)
+
+
+def bench_pdf(results, repeat):
+    for lines in (5, 50, 200):
+        order = make_order(lines)
+        os.remove(generate_pdf(order))  # прогрев: шрифт, кэши reportlab
+        results[f"generate_pdf[{lines}]"] = best_of(
+            lambda: os.remove(generate_pdf(order)), max(1, repeat // (5 if lines >= 200 else 1))
+        )
+
+
+def bench_preview(results, repeat):
+    for lines in (5, 50, 200):
+        order = make_order(lines)
+        for item in order["products"]:
+            item.update(expiry="15.02.2028", sum_no_vat=round(float(item["price_no_vat"]) * item["qty"], 2))
+        results[f"format_order_preview[{lines}]"] = best_of(
+            lambda: main.format_order_preview(order), repeat, number=200
+        )
+
+
+def bench_report(results, repeat):
+    """Отчёт за год по 100k заказов: 40 клиентов, 8 менеджеров, 500 товаров."""
+    rng = random.Random(1)
+    start = date(2025, 1, 1)
+
+    def archive():
+        for i in range(100_000):
+            order = make_order(3)
+            order.update(client=f"Client {i % 40}", manager=f"Manager {i % 8}",
+                         timestamp=(start + timedelta(days=i * 365 // 100_000)).isoformat())
+            for item in order["products"]:
+                item.update(code=f"4792252{rng.randrange(500):06d}", sum_no_vat=4.25, sum_with_vat=5.14)
+            yield order
+
+    sales = SalesReports(os.path.join(TMP, "rollups.json"), archive, lambda: "bench")
+    sales.ensure_built()
+    results["report[year:100000]"] = best_of(
+        lambda: sales.report(start, start + timedelta(days=364)), repeat
+    )
+
+
+GROUPS = {
+    "find_product": bench_find_product,
+    "search": bench_search,
+    "archive": bench_archive,
+    "pdf": bench_pdf,
+    "preview": bench_preview,
+    "report": bench_report,
+}
+
+
+def compare(results, baseline, threshold):
+    """Печатает сравнение с базовым прогоном, возвращает список регрессий."""
+    regressions = []
+    for name, seconds in results.items():
+        before = baseline.get(name)
+        if not before:
+            print(f"  {name:40} {seconds * 1e6:12.2f} µs  (нет в базовом прогоне)")
+            continue
+        change = seconds / before - 1
+        mark = "❌" if change > threshold else "  "
+        print(f"{mark}{name:40} {seconds * 1e6:12.2f} µs  было {before * 1e6:12.2f} µs  {change:+7.1%}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", choices=sorted(GROUPS), action="append", help="запустить только эти группы")
+    parser.add_argument("--save", help="куда записать результаты (JSON)")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимое замедление, доля")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.only or GROUPS:
+        GROUPS[name](results, args.repeat)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+    else:
+        regressions = []
+        for name, seconds in results.items():
+            print(f"  {name:40} {seconds * 1e6:12.2f} µs")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({
+                "meta": {
+                    "date": datetime.now().isoformat(timespec="seconds"),
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                },
+                "results": results,
+            }, f, ensure_ascii=False, indent=2)
+
+    if regressions:
+        print(f"Регрессия больше {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
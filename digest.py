@@ -0,0 +1,123 @@
+# digest.py
+import asyncio
+import json
+import os
+
+# Сводка для бухгалтера: вместо письма на каждый заказ — одно письмо за период
+EMAIL_DIGEST_ENABLED = os.getenv("EMAIL_DIGEST", "0") == "1"
+EMAIL_DIGEST_WINDOW = float(os.getenv("EMAIL_DIGEST_WINDOW", "1800"))  # секунд
+EMAIL_DIGEST_MAX_ORDERS = int(os.getenv("EMAIL_DIGEST_MAX_ORDERS", "20"))
+# Заказы сводки, ещё не отправленные бухгалтеру (переживают перезапуск)
+EMAIL_DIGEST_FILE = os.getenv("EMAIL_DIGEST_FILE", "digest_pending.json")
+URGENT_MARKERS = ("срочно", "urgent")
+
+
+def is_urgent(order):
+    """Срочный заказ уходит отдельным письмом сразу: флаг urgent или «срочно» в примечании."""
+    if order.get("urgent"):
+        return True
+    note = str(order.get("note", "")).lower()
+    return any(marker in note for marker in URGENT_MARKERS)
+
+
+class OrderDigest:
+    """
+    Копит подтверждённые заказы и отдаёт их пачкой в send_batch:
+    через window секунд после первого заказа пачки или сразу при max_orders заказах.
+    Ожидающие заказы пишутся в path при каждом изменении и поднимаются в start():
+    после падения бота сводка не теряется. Если отправка не удалась, пачка
+    возвращается в очередь и уходит со следующей попыткой через window секунд.
+    """
+
+    def __init__(self, send_batch, window=EMAIL_DIGEST_WINDOW, max_orders=EMAIL_DIGEST_MAX_ORDERS,
+                 path=EMAIL_DIGEST_FILE):
+        self._send_batch = send_batch
+        self.window = window
+        self.max_orders = max_orders
+        self.path = path
+        self._orders = []
+        self._sending = []
+        self._timer = None
+
+    @property
+    def pending(self):
+        return len(self._orders)
+
+    def _save(self):
+        if not self.path:
+            return
+        # На диске — и ожидающие, и те, что сейчас отправляются: до успешной отправки они не доставлены
+        tmp_file = self.path + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self._sending + self._orders, f, ensure_ascii=False)
+        os.replace(tmp_file, self.path)
+
+    def start(self):
+        """Поднимает заказы, не отправленные до остановки или падения бота."""
+        if not self.path:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        if saved:
+            print(f"📨 Сводка: восстановлено {len(saved)} неотправленных заказов")
+            self._orders = saved + self._orders
+            self._schedule()
+
+    def _schedule(self):
+        if self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def add(self, order):
+        self._orders.append(order)
+        self._save()
+        if len(self._orders) >= self.max_orders:
+            try:
+                await self.flush()
+            except Exception as e:
+                print("❌ Ошибка отправки сводки заказов:", e)
+        else:
+            self._schedule()
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        self._timer = None
+        try:
+            await self.flush()
+        except Exception as e:
+            print("❌ Ошибка отправки сводки заказов:", e)
+
+    async def flush(self):
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+            self._timer = None
+        if not self._orders:
+            return
+        batch, self._orders = self._orders, []
+        self._sending += batch
+        try:
+            await self._send_batch(batch)
+        except Exception:
+            # Пачка возвращается в начало очереди и уйдёт со следующей попыткой
+            self._orders = batch + self._orders
+            self._schedule()
+            raise
+        finally:
+            self._sending = [order for order in self._sending if not any(order is b for b in batch)]
+            self._save()
+
+    async def close(self):
+        """Отправляет накопленное при остановке бота; при ошибке заказы остаются в path до следующего старта."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        try:
+            await self.flush()
+        except Exception as e:
+            print("❌ Сводка не отправлена, заказы сохранены до следующего запуска:", e)
+        finally:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
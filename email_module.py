@@ -1,29 +1,59 @@
+import asyncio
+import io
+import multiprocessing
 import os
 import smtplib
 import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from email.message import EmailMessage
-from typing import Dict, Any
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from typing import Dict, Any, List
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
+from reportlab.lib.styles import ParagraphStyle
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfbase import pdfmetrics
 from reportlab.lib import colors
 
-# Регистрируем шрифт с кириллицей
-pdfmetrics.registerFont(TTFont('DejaVuSans', 'DejaVuSans.ttf'))
+from metrics import timer
+from prices import price_cents
 
-def generate_pdf(order: Dict[str, Any]) -> str:
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    tmp_name = tmp.name
-    tmp.close()
+_font_registered = False
+
+
+def _ensure_font():
+    """Регистрируем шрифт с кириллицей (разбор TTF — только перед первым PDF)."""
+    global _font_registered
+    if not _font_registered:
+        pdfmetrics.registerFont(TTFont('DejaVuSans', 'DejaVuSans.ttf'))
+        _font_registered = True
+
+# Стили создаются один раз на процесс и переиспользуются для всех заказов
+RUSSIAN_STYLE = ParagraphStyle(name='Russian', fontName='DejaVuSans', fontSize=10, leading=12)
+HEADER_STYLE = ParagraphStyle(name='Header', fontName='DejaVuSans', fontSize=16, alignment=1, spaceAfter=15)
+
+INFO_TABLE_STYLE = TableStyle([
+    ('FONTNAME', (0, 0), (-1, -1), 'DejaVuSans'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+])
+
+PRODUCT_TABLE_STYLE = TableStyle([
+    ('FONTNAME', (0, 0), (-1, -1), 'DejaVuSans'),
+    ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4A90E2')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('ALIGN', (3, 1), (-1, -1), 'CENTER'),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.whitesmoke, colors.lightgrey])
+])
+
+PRODUCT_TABLE_HEADER = ["Код", "Товар", "Название", "Кол-во", "Без PVN", "C PVN", "Сумма(€)"]
 
-    doc = SimpleDocTemplate(tmp_name)
-    styles = getSampleStyleSheet()
-    styles.add(ParagraphStyle(name='Russian', fontName='DejaVuSans', fontSize=10, leading=12))
-    styles.add(ParagraphStyle(name='Header', fontName='DejaVuSans', fontSize=16, alignment=1, spaceAfter=15))
 
+def _order_elements(order: Dict[str, Any], title: str = "Заказ") -> list:
     elements = []
-    elements.append(Paragraph("Заказ", styles['Header']))
+    elements.append(Paragraph(title, HEADER_STYLE))
 
     # Информация о заказе
     order_info = [
@@ -34,25 +64,19 @@ def generate_pdf(order: Dict[str, Any]) -> str:
         ["Примечание:", order.get('note', '')],
     ]
     info_table = Table(order_info, colWidths=[100, 400])
-    info_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, -1), 'DejaVuSans'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-    ]))
+    info_table.setStyle(INFO_TABLE_STYLE)
     elements.append(info_table)
     elements.append(Spacer(1, 15))
 
     # Таблица товаров с extra_code
-    table_data = [["Код", "Товар", "Название", "Кол-во", "Без PVN", "C PVN", "Сумма(€)"]]
+    table_data = [PRODUCT_TABLE_HEADER]
     total_sum = 0
     for item in order.get('products', []):
         extra_code = item.get('extra_code', '')
 
         # Считаем сумму с НДС
         try:
-            sum_with_vat = float(item.get('price_with_vat', 0)) * int(item.get('qty', 0))
+            sum_with_vat = (price_cents(item, 'price_with_vat') or 0) * int(item.get('qty', 0)) / 100
         except ValueError:
             sum_with_vat = 0
 
@@ -70,75 +94,205 @@ def generate_pdf(order: Dict[str, Any]) -> str:
         ])
 
     product_table = Table(table_data, colWidths=[90, 40, 300, 30, 35, 35, 40])
-    product_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, -1), 'DejaVuSans'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4A90E2')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('ALIGN', (3, 1), (-1, -1), 'CENTER'),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.whitesmoke, colors.lightgrey])
-    ]))
+    product_table.setStyle(PRODUCT_TABLE_STYLE)
     elements.append(product_table)
     elements.append(Spacer(1, 15))
 
-    elements.append(Paragraph(f"<b>Общая сумма заказа:</b> {total_sum:.2f} €", styles['Russian']))
+    elements.append(Paragraph(f"<b>Общая сумма заказа:</b> {total_sum:.2f} €", RUSSIAN_STYLE))
+    return elements
 
-    doc.build(elements)
-    return tmp_name
 
+def render_pdf(order: Dict[str, Any]) -> bytes:
+    """Собирает PDF заказа в памяти и возвращает его содержимое."""
+    _ensure_font()
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer)
+    doc.build(_order_elements(order))
+    return buffer.getvalue()
 
-def send_email_with_pdf(order: Dict[str, Any], sender: str, password: str, recipient: str):
-    pdf_path = None
-    try:
-        pdf_path = generate_pdf(order)
-
-        msg = EmailMessage()
-        msg['Subject'] = f"Новый заказ от {order.get('manager','')}"
-        msg['From'] = sender
-        msg['To'] = recipient
-
-        # Текстовая версия
-        plain_lines = [
-            "Новый заказ!",
-            f"Менеджер: {order.get('manager','')}",
-            f"Клиент: {order.get('client','')}",
-            f"Дата доставки: {order.get('delivery_date','')}",
-            f"Адрес: {order.get('delivery_address','')}",
-            f"Примечание: {order.get('note','')}",
-            "",
-            "Товары:"
-        ]
-        for p in order.get('products', []):
-            plain_lines.append(f"{p.get('code','N/A')} | {p.get('extra_code','')} | {p.get('name','')[:45]:45} | {p.get('qty',0)}")
-        msg.set_content("\n".join(plain_lines))
-
-        # HTML версия
-        product_rows = "".join(
-            f"<tr><td>{p.get('code','N/A')}</td><td>{p.get('extra_code','')}</td><td>{p.get('name','')}</td><td style='text-align:center'>{p.get('qty',0)}</td></tr>"
-            for p in order.get('products', [])
+
+# Рендер PDF в пуле процессов: 0 — рендерим в потоке (asyncio.to_thread)
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "0"))
+_pdf_pool = None
+
+
+def _init_pdf_worker():
+    # Пробный рендер регистрирует шрифт и прогревает кэши reportlab в воркере
+    render_pdf({"products": []})
+
+
+def start_pdf_pool(workers: int = PDF_WORKERS):
+    """
+    Поднимает пул процессов для рендера и сразу запускает все воркеры,
+    чтобы первый заказ не ждал старта процесса. Вызывать при старте бота.
+    """
+    global _pdf_pool
+    if workers <= 0 or _pdf_pool is not None:
+        return _pdf_pool
+    # Не fork: копия процесса с потоками и открытыми сокетами бота может зависнуть
+    # на чужой блокировке. forkserver заранее импортирует только этот модуль
+    # с reportlab, и воркеры стартуют от него; где forkserver нет — spawn
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+    else:
+        context = multiprocessing.get_context("spawn")
+    _pdf_pool = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_pdf_worker)
+    for future in [_pdf_pool.submit(os.getpid) for _ in range(workers)]:
+        future.result()
+    return _pdf_pool
+
+
+def shutdown_pdf_pool():
+    global _pdf_pool
+    if _pdf_pool is not None:
+        _pdf_pool.shutdown()
+        _pdf_pool = None
+
+
+async def _render_async(render, arg) -> bytes:
+    with timer("dependency_seconds", dependency="pdf", op=render.__name__):
+        if _pdf_pool is not None:
+            return await asyncio.get_running_loop().run_in_executor(_pdf_pool, render, arg)
+        return await asyncio.to_thread(render, arg)
+
+
+async def render_pdf_async(order: Dict[str, Any]) -> bytes:
+    """Рендер PDF без блокировки event loop: в пуле процессов, если он поднят, иначе в потоке."""
+    return await _render_async(render_pdf, order)
+
+
+def _order_total(order: Dict[str, Any]) -> float:
+    total = 0
+    for item in order.get('products', []):
+        try:
+            total += (price_cents(item, 'price_with_vat') or 0) * int(item.get('qty', 0)) / 100
+        except ValueError:
+            pass
+    return total
+
+
+def render_digest_pdf(orders: List[Dict[str, Any]]) -> bytes:
+    """Один PDF на несколько заказов: раздел на каждый заказ и итоговая страница."""
+    _ensure_font()
+    elements = []
+    for number, order in enumerate(orders, 1):
+        elements.extend(_order_elements(order, title=f"Заказ {number} из {len(orders)}"))
+        elements.append(PageBreak())
+
+    elements.append(Paragraph("Итого за период", HEADER_STYLE))
+    totals = [["№", "Менеджер", "Клиент", "Дата доставки", "Позиций", "Сумма(€)"]]
+    grand_total = 0
+    for number, order in enumerate(orders, 1):
+        order_sum = _order_total(order)
+        grand_total += order_sum
+        totals.append([
+            number,
+            order.get('manager', ''),
+            order.get('client', ''),
+            order.get('delivery_date', ''),
+            len(order.get('products', [])),
+            f"{order_sum:.2f}"
+        ])
+    totals_table = Table(totals, colWidths=[25, 100, 170, 80, 50, 60])
+    totals_table.setStyle(PRODUCT_TABLE_STYLE)
+    elements.append(totals_table)
+    elements.append(Spacer(1, 15))
+    elements.append(Paragraph(f"<b>Заказов:</b> {len(orders)}, <b>общая сумма:</b> {grand_total:.2f} €", RUSSIAN_STYLE))
+
+    buffer = io.BytesIO()
+    SimpleDocTemplate(buffer).build(elements)
+    return buffer.getvalue()
+
+
+async def render_digest_pdf_async(orders: List[Dict[str, Any]]) -> bytes:
+    return await _render_async(render_digest_pdf, orders)
+
+
+def generate_pdf(order: Dict[str, Any]) -> str:
+    """Старый интерфейс: пишет PDF во временный файл и возвращает путь."""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
+        tmp.write(render_pdf(order))
+    return tmp.name
+
+
+def build_order_message(order: Dict[str, Any], sender: str, recipient: str, pdf_bytes: bytes) -> EmailMessage:
+    """Письмо бухгалтеру: текст, HTML и PDF во вложении."""
+    msg = EmailMessage()
+    msg['Subject'] = f"Новый заказ от {order.get('manager','')}"
+    msg['From'] = sender
+    msg['To'] = recipient
+
+    # Текстовая версия
+    plain_lines = [
+        "Новый заказ!",
+        f"Менеджер: {order.get('manager','')}",
+        f"Клиент: {order.get('client','')}",
+        f"Дата доставки: {order.get('delivery_date','')}",
+        f"Адрес: {order.get('delivery_address','')}",
+        f"Примечание: {order.get('note','')}",
+        "",
+        "Товары:"
+    ]
+    for p in order.get('products', []):
+        plain_lines.append(f"{p.get('code','N/A')} | {p.get('extra_code','')} | {p.get('name','')[:45]:45} | {p.get('qty',0)}")
+    msg.set_content("\n".join(plain_lines))
+
+    # HTML версия
+    product_rows = "".join(
+        f"<tr><td>{p.get('code','N/A')}</td><td>{p.get('extra_code','')}</td><td>{p.get('name','')}</td><td style='text-align:center'>{p.get('qty',0)}</td></tr>"
+        for p in order.get('products', [])
+    )
+    html = f"""
+    <html>
+      <body>
+        <h2>📦 Новый заказ от менеджера {order.get('manager','')}</h2>
+        <p><strong>Клиент:</strong> {order.get('client','')}<br>
+           <strong>Адрес:</strong> {order.get('delivery_address','')}<br>
+           <strong>Дата:</strong> {order.get('delivery_date','')}<br>
+           <strong>Примечание:</strong> {order.get('note','')}</p>
+        <h3>Состав заказа:</h3>
+        <table border="1" cellpadding="6" cellspacing="0" style="border-collapse: collapse;">
+          <tr style="background:#f2f2f2;"><th>Код</th><th>Товар</th><th>Название</th><th>Кол-во</th></tr>
+          {product_rows}
+        </table>
+      </body>
+    </html>
+    """
+    msg.add_alternative(html, subtype="html")
+
+    # Прикрепляем PDF
+    msg.add_attachment(pdf_bytes, maintype="application", subtype="pdf", filename="order.pdf")
+    return msg
+
+
+def build_digest_message(orders: List[Dict[str, Any]], sender: str, recipient: str, pdf_bytes: bytes) -> EmailMessage:
+    """Сводное письмо бухгалтеру: список заказов и общий PDF во вложении."""
+    msg = EmailMessage()
+    msg['Subject'] = f"Сводка заказов: {len(orders)} шт."
+    msg['From'] = sender
+    msg['To'] = recipient
+
+    lines = [f"Заказов в сводке: {len(orders)}", ""]
+    for number, order in enumerate(orders, 1):
+        lines.append(
+            f"{number}) {order.get('manager','')} → {order.get('client','')} | "
+            f"доставка {order.get('delivery_date','')} | позиций {len(order.get('products', []))} | "
+            f"{_order_total(order):.2f} €"
         )
-        html = f"""
-        <html>
-          <body>
-            <h2>📦 Новый заказ от менеджера {order.get('manager','')}</h2>
-            <p><strong>Клиент:</strong> {order.get('client','')}<br>
-               <strong>Адрес:</strong> {order.get('delivery_address','')}<br>
-               <strong>Дата:</strong> {order.get('delivery_date','')}<br>
-               <strong>Примечание:</strong> {order.get('note','')}</p>
-            <h3>Состав заказа:</h3>
-            <table border="1" cellpadding="6" cellspacing="0" style="border-collapse: collapse;">
-              <tr style="background:#f2f2f2;"><th>Код</th><th>Товар</th><th>Название</th><th>Кол-во</th></tr>
-              {product_rows}
-            </table>
-          </body>
-        </html>
-        """
-        msg.add_alternative(html, subtype="html")
-
-        # Прикрепляем PDF
-        with open(pdf_path, "rb") as f:
-            msg.add_attachment(f.read(), maintype="application", subtype="pdf", filename="order.pdf")
+    lines.append("")
+    lines.append("Подробности каждого заказа — в приложенном PDF.")
+    msg.set_content("\n".join(lines))
+
+    msg.add_attachment(pdf_bytes, maintype="application", subtype="pdf", filename="orders_digest.pdf")
+    return msg
+
+
+def send_email_with_pdf(order: Dict[str, Any], sender: str, password: str, recipient: str, pdf_bytes: bytes = None):
+    try:
+        if pdf_bytes is None:
+            pdf_bytes = render_pdf(order)
+        msg = build_order_message(order, sender, recipient, pdf_bytes)
 
         # Отправка письма
         with smtplib.SMTP_SSL("smtp.gmail.com", 465) as smtp:
@@ -150,6 +304,3 @@ def send_email_with_pdf(order: Dict[str, Any], sender: str, password: str, recip
     except Exception as e:
         print("❌ Ошибка при отправке письма:", e)
         raise
-    finally:
-        if pdf_path and os.path.exists(pdf_path):
-            os.remove(pdf_path)
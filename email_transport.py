@@ -0,0 +1,154 @@
+# email_transport.py
+import asyncio
+import os
+from email.message import EmailMessage
+
+import aiosmtplib
+
+from metrics import timer
+
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "465"))
+SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "1") == "1"  # 465 — TLS сразу, как SMTP_SSL
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT", "240"))
+
+# Ошибки, после которых сессию считаем мёртвой и переподключаемся
+RECONNECT_ERRORS = (
+    aiosmtplib.SMTPServerDisconnected,
+    aiosmtplib.SMTPConnectError,
+    aiosmtplib.SMTPTimeoutError,
+    ConnectionError,
+)
+
+
+class _SMTP(aiosmtplib.SMTP):
+    """SMTP-сессия, которая помнит, дошла ли отправка письма до команды DATA."""
+
+    data_started = False
+
+    async def data(self, *args, **kwargs):
+        self.data_started = True
+        return await super().data(*args, **kwargs)
+
+
+class SMTPPool:
+    """
+    Пул авторизованных SMTP-сессий.
+    Письма встают в общую очередь, каждый из size воркеров держит своё
+    соединение и отправляет письма по нему одно за другим. Соединение
+    закрывается после idle_timeout секунд простоя и переоткрывается при обрыве.
+    Письмо повторяется на новом соединении, только если обрыв случился до DATA:
+    после DATA сервер мог уже принять письмо, и повтор дал бы бухгалтеру дубль.
+    """
+
+    def __init__(self, username, password, hostname=SMTP_HOST, port=SMTP_PORT,
+                 use_tls=SMTP_USE_TLS, size=SMTP_POOL_SIZE, idle_timeout=SMTP_IDLE_TIMEOUT):
+        self.username = username
+        self.password = password
+        self.hostname = hostname
+        self.port = port
+        self.use_tls = use_tls
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self._queue = None
+        self._workers = []
+        self.connects = 0
+        self.sent = 0
+
+    async def send(self, message: EmailMessage):
+        """Ставит письмо в очередь и ждёт, пока оно уйдёт на сервер."""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.size)]
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((message, future))
+        return await future
+
+    async def _connect(self):
+        smtp = _SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            use_tls=self.use_tls,
+            username=self.username or None,
+            password=self.password or None,
+        )
+        with timer("dependency_seconds", dependency="smtp", op="connect"):
+            await smtp.connect()
+        self.connects += 1
+        return smtp
+
+    @staticmethod
+    async def _close_session(smtp):
+        try:
+            await smtp.quit()
+        except Exception:
+            smtp.close()
+
+    async def _worker(self):
+        smtp = None
+        future = None
+        try:
+            while True:
+                try:
+                    message, future = await asyncio.wait_for(self._queue.get(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    if smtp is not None:
+                        await self._close_session(smtp)
+                        smtp = None
+                    continue
+
+                if future.done():
+                    self._queue.task_done()
+                    continue
+                for attempt in (1, 2):
+                    try:
+                        if smtp is None or not smtp.is_connected:
+                            smtp = await self._connect()
+                        smtp.data_started = False
+                        with timer("dependency_seconds", dependency="smtp", op="send"):
+                            await smtp.send_message(message)
+                        self.sent += 1
+                        if not future.done():
+                            future.set_result(None)
+                        break
+                    except RECONNECT_ERRORS as e:
+                        data_started = smtp is not None and smtp.data_started
+                        if smtp is not None:
+                            smtp.close()
+                            smtp = None
+                        if (attempt == 2 or data_started) and not future.done():
+                            future.set_exception(e)
+                        if data_started:
+                            break
+                    except Exception as e:
+                        if not future.done():
+                            future.set_exception(e)
+                        break
+                self._queue.task_done()
+        finally:
+            if future is not None and not future.done():
+                future.set_exception(aiosmtplib.SMTPServerDisconnected("SMTP pool closed"))
+            if smtp is not None:
+                await self._close_session(smtp)
+
+    async def close(self, drain_timeout=30):
+        """
+        Дожидается отправки очереди (не дольше drain_timeout секунд)
+        и закрывает соединения; неотправленные письма получают ошибку.
+        """
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), drain_timeout)
+            except asyncio.TimeoutError:
+                print("⚠️ Не все письма успели уйти до остановки")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._queue is not None:
+            while not self._queue.empty():
+                _, future = self._queue.get_nowait()
+                if not future.done():
+                    future.set_exception(aiosmtplib.SMTPServerDisconnected("SMTP pool closed"))
+            self._queue = None
@@ -0,0 +1,122 @@
+# fsm_storage.py
+import asyncio
+import copy
+import json
+import sqlite3
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL
+);
+"""
+
+
+def _key_to_str(key: StorageKey) -> str:
+    return ":".join(str(part) for part in (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny
+    ))
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM-хранилище aiogram в локальной SQLite-базе с отложенной записью.
+    Все сессии держатся в памяти (обработчики работают со скоростью MemoryStorage),
+    изменённые ключи пишутся в базу пачкой раз в flush_interval секунд и при close().
+    """
+
+    def __init__(self, path: str = "fsm_state.db", flush_interval: float = 1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._conn = None
+        self._states: Dict[str, Optional[str]] = {}
+        self._data: Dict[str, Dict[str, Any]] = {}
+        self._dirty = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._closing = asyncio.Event()
+
+    def _ensure_loaded(self) -> None:
+        # База открывается при первом обращении, а не при создании Dispatcher
+        if self._conn is not None:
+            return
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        for key, state, data in self._conn.execute("SELECT key, state, data FROM fsm"):
+            self._states[key] = state
+            self._data[key] = json.loads(data)
+
+    def _mark_dirty(self, key: str) -> None:
+        self._dirty.add(key)
+        if self._closing.is_set():
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        while self._dirty and not self._closing.is_set():
+            try:
+                await asyncio.wait_for(self._closing.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Записывает в базу все изменённые с прошлого сброса сессии."""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            keys, self._dirty = self._dirty, set()
+            upserts, deletes = [], []
+            for key in keys:
+                state, data = self._states.get(key), self._data.get(key, {})
+                if state is None and not data:
+                    deletes.append((key,))
+                else:
+                    upserts.append((key, state, json.dumps(data, ensure_ascii=False)))
+            try:
+                await asyncio.to_thread(self._write, upserts, deletes)
+            except Exception as e:
+                # База занята или диск полон: сессии остаются изменёнными, запишем при следующем сбросе
+                self._dirty |= keys
+                print("❌ Ошибка сохранения FSM-сессий:", e)
+
+    def _write(self, upserts, deletes) -> None:
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO fsm (key, state, data) VALUES (?, ?, ?)", upserts)
+            self._conn.executemany("DELETE FROM fsm WHERE key = ?", deletes)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        self._ensure_loaded()
+        k = _key_to_str(key)
+        self._states[k] = state.state if isinstance(state, State) else state
+        self._mark_dirty(k)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        self._ensure_loaded()
+        return self._states.get(_key_to_str(key))
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        self._ensure_loaded()
+        k = _key_to_str(key)
+        self._data[k] = dict(data)
+        self._mark_dirty(k)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        self._ensure_loaded()
+        return copy.copy(self._data.get(_key_to_str(key), {}))
+
+    async def close(self) -> None:
+        self._closing.set()
+        if self._flush_task is not None:
+            await self._flush_task
+        await self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
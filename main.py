@@ -1,8 +1,9 @@
 from aiogram import Bot, Dispatcher, types
 from aiogram.filters import Command
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
 import asyncio
 import os
 from dotenv import load_dotenv
@@ -18,23 +19,50 @@ EMAIL_SENDER = os.getenv("EMAIL_SENDER")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
 EMAIL_RECIPIENT = os.getenv("EMAIL_RECIPIENT")
 credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credentials_path
+if credentials_path:
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credentials_path
 
 # Проверка, что все переменные подгрузились
 if not all([BOT_TOKEN, EMAIL_SENDER, EMAIL_PASSWORD, EMAIL_RECIPIENT]):
     raise ValueError("Не все переменные окружения найдены. Проверь .env файл.")
 
+# Режим работы: polling (по умолчанию) или webhook
+RUN_MODE = os.getenv("RUN_MODE", "polling")
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")  # публичный https-адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None  # обязателен в режиме webhook
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+
+# Inline-поиск (@bot oolong): товаров на страницу и сколько секунд Telegram кэширует ответ
+INLINE_PAGE_SIZE = int(os.getenv("INLINE_PAGE_SIZE", "20"))
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "60"))
+
 from orders import (
     init_order, update_order, get_order, save_user_order_state,
-    send_order_email, write_order_to_archive, load_orders, save_orders
+    submit_order_email, order_digest, close_smtp_pool, order_commits, restore_drafts, close_drafts, drop_order,
+    sales_reports, rotate_archive
 )
+from reports import ADMIN_IDS, parse_period, format_report
 
-from products import find_product_by_code_ending
+from products import catalog
+from prices import line_totals
+from stock import stock_ledger
+from fsm_storage import SQLiteStorage
+from sheets_sync import temp_orders_sync
+from email_module import start_pdf_pool, shutdown_pdf_pool
+from middlewares import HandlerTimingMiddleware, TelegramTimingMiddleware
+import metrics
 
 # Создаём экземпляры бота и диспетчера
 bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
+# Сессии переживают перезапуск: FSM пишется в локальную базу пачками
+storage = SQLiteStorage(os.getenv("FSM_DB", "fsm_state.db"), flush_interval=float(os.getenv("FSM_FLUSH_INTERVAL", "1.0")))
 dp = Dispatcher(storage=storage)
+dp.message.middleware(HandlerTimingMiddleware())
+dp.callback_query.middleware(HandlerTimingMiddleware())
+dp.inline_query.middleware(HandlerTimingMiddleware())
+bot.session.middleware(TelegramTimingMiddleware())
 
 
 class OrderState(StatesGroup):
@@ -52,11 +80,30 @@ class OrderState(StatesGroup):
     # флаг editing_mode хранится в state.data (editing_mode: True/False)
 
 
+# ----------------- ОТЧЁТЫ ДЛЯ АДМИНИСТРАТОРОВ -----------------
+# Регистрируется до обработчиков состояний: команда работает на любом шаге заказа
+@dp.message(Command("report"))
+async def cmd_report(msg: types.Message):
+    """/report, /report 2025-08, /report 01.08.2025 31.08.2025 — продажи за период."""
+    if msg.from_user.id not in ADMIN_IDS:
+        await msg.answer("⛔ Отчёты доступны только администраторам.")
+        return
+    args = (msg.text or "").split()[1:]
+    try:
+        date_from, date_to = parse_period(args)
+    except ValueError:
+        await msg.answer("Формат: /report, /report 2025-08 или /report 01.08.2025 31.08.2025")
+        return
+    report = await asyncio.to_thread(sales_reports.report, date_from, date_to)
+    await msg.answer(format_report(report, date_from, date_to))
+
+
 # ----------------- START / MANAGER / CLIENT -----------------
 @dp.message(Command("start"))
 async def start(msg: types.Message, state: FSMContext):
     await msg.answer("Добро пожаловать в Alanika OrderBot!👋🏻\nВведите ваше имя:")
     init_order(msg.from_user.id)
+    stock_ledger.release(msg.from_user.id)
     await state.set_state(OrderState.manager)
 
 
@@ -70,13 +117,15 @@ async def set_manager(msg: types.Message, state: FSMContext):
 @dp.message(OrderState.client)
 async def set_client(msg: types.Message, state: FSMContext):
     update_order(msg.from_user.id, "client", msg.text)
+    temp_orders_sync.schedule(msg.from_user.id, get_order(msg.from_user.id))
     keyboard = types.ReplyKeyboardMarkup(
         keyboard=[[types.KeyboardButton(text="Готово")]],
         resize_keyboard=True,
         one_time_keyboard=True
     )
     await msg.answer(
-        "✅ Клиент сохранён.\nВведите последние 4️⃣ цифр кода товара или нажмите 'Готово', если товаров больше нет.",
+        "✅ Клиент сохранён.\nВведите последние 4️⃣ цифр кода товара или часть названия, "
+        "либо нажмите 'Готово', если товаров больше нет.",
         reply_markup=keyboard
     )
     await state.set_state(OrderState.product_code)
@@ -101,11 +150,15 @@ async def handle_product_code(msg: types.Message, state: FSMContext):
         return
 
     text = msg.text.strip()
-    if not (text.isdigit() and len(text) == 4):
-        await msg.answer("❗ Введите ровно 4️⃣ цифр кода товара.")
+    if text.isdigit() and len(text) == 4:
+        found_products = await catalog.find_by_suffix(text)
+    elif len(text) >= 2:
+        # Не 4 цифры — ищем по части названия, "Товар" или кода
+        found_products = await catalog.search_by_name(text)
+    else:
+        await msg.answer("❗ Введите последние 4️⃣ цифр кода или хотя бы 2 буквы названия.")
         return
 
-    found_products = find_product_by_code_ending(text)
     if not found_products:
         await msg.answer("❌ Товар не найден. Проверьте код и попробуйте снова.")
         return
@@ -143,7 +196,10 @@ async def cb_select_product(call: types.CallbackQuery, state: FSMContext):
         return
 
     product = found_products[idx]
-    await state.update_data(product=product)
+    # Список вариантов больше не нужен — не держим его в сессии
+    data.pop("found_products", None)
+    data["product"] = product
+    await state.set_data(data)
     await call.message.edit_reply_markup(None)  # удаляем кнопки выбора
 
     # Показ карточки товара с кнопками Добавить/Отменить
@@ -152,10 +208,16 @@ async def cb_select_product(call: types.CallbackQuery, state: FSMContext):
 
 # ----------------- Функция: показать карточку товара -----------------
 async def show_product_card(msg_obj, product, state):
+    # Остаток за вычетом резервов других менеджеров и продаж, ещё не списанных в таблице
+    available = stock_ledger.available(product["code"], product["stock"], state.key.user_id)
+    if available is None or str(available) == str(product["stock"]):
+        stock_text = f"{product['stock']}"
+    else:
+        stock_text = f"{available} (в таблице {product['stock']})"
     info = (
         f"🔎 Найден товар:\n"
         f"📦 {product['name']}\n"
-        f"📦 Остаток: {product['stock']}\n"
+        f"📦 Остаток: {stock_text}\n"
         f"🕐 Срок годности: {product['expiry']}\n"
         f"💶 Цена без НДС: {product['price_no_vat']} €\n"
         f"💶 Цена с НДС: {product['price_with_vat']} €\n\n"
@@ -236,9 +298,15 @@ async def handle_product_qty(msg: types.Message, state: FSMContext):
         return
 
     qty = int(msg.text)
+    totals = line_totals(product, qty)
+    if totals is None:
+        # Пустая или нечисловая цена в таблице — не считаем такую строку бесплатной
+        await msg.answer("❌ У этого товара в таблице нет корректной цены, добавить его нельзя. "
+                         "Введите другой код товара.")
+        await state.set_state(OrderState.product_code)
+        return
     product["qty"] = qty
-    product["sum_no_vat"] = round(float(product["price_no_vat"]) * qty, 2)
-    product["sum_with_vat"] = round(float(product["price_with_vat"]) * qty, 2)
+    product["sum_no_vat"], product["sum_with_vat"] = totals
     product["code"] = product.get("code", "N/A")
 
     user_id = msg.from_user.id
@@ -254,9 +322,22 @@ async def handle_product_qty(msg: types.Message, state: FSMContext):
     data = await state.get_data()
     editing_mode = data.get("editing_mode", False)
 
+    # Резервируем товар, пока заказ не подтверждён или не отменён
+    shortage = stock_ledger.hold(user_id, current["products"] + [product])
+    if shortage:
+        _, available = shortage
+        if available <= 0:
+            await msg.answer("❌ Товара не осталось: всё в резерве у других менеджеров или уже продано. "
+                             "Введите другой код товара.")
+            await state.set_state(OrderState.product_code)
+        else:
+            await msg.answer(f"❗ Доступно только {available} шт. Введите меньшее количество.")
+        return
+
     # Добавляем товар
     current["products"].append(product)
     update_order(user_id, "products", current["products"])
+    temp_orders_sync.schedule(user_id, current)
 
     if editing_mode:
         # Сбросим флаг и покажем предпросмотр (не переводя на note)
@@ -282,6 +363,7 @@ async def handle_note(msg: types.Message, state: FSMContext):
     from_details = data.get("from_details_edit", False)
 
     update_order(msg.from_user.id, "note", msg.text)
+    temp_orders_sync.schedule(msg.from_user.id, get_order(msg.from_user.id))
 
     if from_details:
         # очистим флаг и вернём предпросмотр
@@ -300,6 +382,7 @@ async def handle_delivery_date(msg: types.Message, state: FSMContext):
     from_details = data.get("from_details_edit", False)
 
     update_order(msg.from_user.id, "delivery_date", msg.text)
+    temp_orders_sync.schedule(msg.from_user.id, get_order(msg.from_user.id))
 
     if from_details:
         await state.update_data(from_details_edit=False)
@@ -317,6 +400,7 @@ async def handle_delivery_address(msg: types.Message, state: FSMContext):
     from_details = data.get("from_details_edit", False)
 
     update_order(msg.from_user.id, "delivery_address", msg.text)
+    temp_orders_sync.schedule(msg.from_user.id, get_order(msg.from_user.id))
 
     if from_details:
         await state.update_data(from_details_edit=False)
@@ -330,6 +414,28 @@ async def handle_delivery_address(msg: types.Message, state: FSMContext):
 
 
 # ----------------- SEND ORDER PREVIEW (INLINE BUTTONS) -----------------
+def format_order_preview(order: dict) -> str:
+    """Текст предпросмотра заказа (без кнопок)."""
+    products_list = "".join(
+        f"{i}) {item['name']} — {item['qty']} шт\n"
+        f"   Срок: {item.get('expiry')}\n"
+        f"   Цена без НДС: {item.get('price_no_vat')} € | с НДС: {item.get('price_with_vat')} €\n"
+        f"   ➡️ Сумма: {item.get('sum_no_vat')} €\n\n"
+        for i, item in enumerate(order.get("products", []), 1)
+    )
+
+    return (
+        f"🧾 Предпросмотр заказа:\n"
+        f"👤 Менеджер: {order.get('manager')}\n"
+        f"💎 Клиент: {order.get('client')}\n"
+        f"📅 Доставка: {order.get('delivery_date')}\n"
+        f"📍 Адрес: {order.get('delivery_address')}\n\n"
+        f"📦 Товары:\n{products_list}"
+        f"📋 Примечание: {order.get('note')}\n\n"
+        f"✅ Всё верно — выберите действие:"
+    )
+
+
 async def send_order_preview(msg_obj: types.Message | types.CallbackQuery, user_id: int):
     """
     Отправляет предпросмотр заказа с 4 inline-кнопками:
@@ -346,25 +452,7 @@ async def send_order_preview(msg_obj: types.Message | types.CallbackQuery, user_
         await chat_msg.answer("Ошибка: заказ не найден.")
         return
 
-    products_list = ""
-    for i, item in enumerate(order.get("products", []), 1):
-        products_list += (
-            f"{i}) {item['name']} — {item['qty']} шт\n"
-            f"   Срок: {item.get('expiry')}\n"
-            f"   Цена без НДС: {item.get('price_no_vat')} € | с НДС: {item.get('price_with_vat')} €\n"
-            f"   ➡️ Сумма: {item.get('sum_no_vat')} €\n\n"
-        )
-
-    preview = (
-        f"🧾 Предпросмотр заказа:\n"
-        f"👤 Менеджер: {order.get('manager')}\n"
-        f"💎 Клиент: {order.get('client')}\n"
-        f"📅 Доставка: {order.get('delivery_date')}\n"
-        f"📍 Адрес: {order.get('delivery_address')}\n\n"
-        f"📦 Товары:\n{products_list}"
-        f"📋 Примечание: {order.get('note')}\n\n"
-        f"✅ Всё верно — выберите действие:"
-    )
+    preview = format_order_preview(order)
 
     ikb = types.InlineKeyboardMarkup(
         inline_keyboard=[
@@ -393,13 +481,16 @@ async def cb_confirm_order(call: types.CallbackQuery, state: FSMContext):
         await call.message.answer("Ошибка: заказ не найден.")
         return
 
-    import asyncio
-    asyncio.create_task(asyncio.to_thread(send_order_email, order))
-    asyncio.create_task(asyncio.to_thread(write_order_to_archive, order))
-    write_order_to_archive(order)
-    orders = load_orders()
-    orders.pop(str(user_id), None)
-    save_orders(orders)
+    try:
+        # Ответ — только после надёжной записи: заказ уходит в архив пачкой с соседними подтверждениями
+        await order_commits.submit(user_id, order)
+    except Exception:
+        await call.message.answer("❌ Не удалось сохранить заказ. Попробуйте подтвердить ещё раз.")
+        return
+    drop_order(user_id)
+    _send_order_email_later(order)
+    stock_ledger.commit(user_id, order.get("products", []))
+    temp_orders_sync.schedule_delete(user_id)
 
     try:
         await call.message.edit_reply_markup(reply_markup=None)
@@ -427,6 +518,8 @@ async def cb_cancel_order(call: types.CallbackQuery, state: FSMContext):
         resize_keyboard=True,
         one_time_keyboard=True
     )
+    temp_orders_sync.schedule_delete(call.from_user.id)
+    stock_ledger.release(call.from_user.id)
     await call.message.answer("❌ Заказ не отправлен. Вы можете начать заново.", reply_markup=kb)
     await state.clear()
 
@@ -551,15 +644,26 @@ async def handle_editing_qty(msg: types.Message, state: FSMContext):
 
     if qty == 0:
         products.pop(idx)
+        stock_ledger.hold(msg.from_user.id, products)  # уменьшение резерва проходит всегда
         await msg.answer("Товар удалён из заказа.")
     else:
         product = products[idx]
+        totals = line_totals(product, qty)
+        if totals is None:
+            await msg.answer("❌ У этого товара нет корректной цены. Удалите его из заказа (количество 0).")
+            return
+        shortage = stock_ledger.hold(
+            msg.from_user.id, products[:idx] + [dict(product, qty=qty)] + products[idx + 1:]
+        )
+        if shortage:
+            await msg.answer(f"❗ Доступно только {shortage[1]} шт. Введите меньшее количество.")
+            return
         product["qty"] = qty
-        product["sum_no_vat"] = round(float(product["price_no_vat"]) * qty, 2)
-        product["sum_with_vat"] = round(float(product["price_with_vat"]) * qty, 2)
+        product["sum_no_vat"], product["sum_with_vat"] = totals
         await msg.answer(f"Количество для товара '{product['name']}' изменено на {qty}.")
 
     update_order(msg.from_user.id, "products", products)
+    temp_orders_sync.schedule(msg.from_user.id, get_order(msg.from_user.id))
 
     # После редактирования — показать предпросмотр (без перехода к note)
     await send_order_preview(msg, msg.from_user.id)
@@ -627,13 +731,16 @@ async def handle_submit_text(msg: types.Message, state: FSMContext):
         await msg.answer("Ошибка: заказ не найден.")
         return
 
-    import asyncio
-    asyncio.create_task(asyncio.to_thread(send_order_email, order))
-    asyncio.create_task(asyncio.to_thread(write_order_to_archive, order))
-    write_order_to_archive(order)
-    orders = load_orders()
-    orders.pop(str(user_id), None)
-    save_orders(orders)
+    try:
+        # Ответ — только после надёжной записи: заказ уходит в архив пачкой с соседними подтверждениями
+        await order_commits.submit(user_id, order)
+    except Exception:
+        await msg.answer("❌ Не удалось сохранить заказ. Попробуйте подтвердить ещё раз.")
+        return
+    drop_order(user_id)
+    _send_order_email_later(order)
+    stock_ledger.commit(user_id, order.get("products", []))
+    temp_orders_sync.schedule_delete(user_id)
 
     kb = types.ReplyKeyboardMarkup(
         keyboard=[[types.KeyboardButton(text="Создать новый заказ")]],
@@ -651,6 +758,8 @@ async def handle_cancel_text(msg: types.Message, state: FSMContext):
         resize_keyboard=True,
         one_time_keyboard=True
     )
+    temp_orders_sync.schedule_delete(msg.from_user.id)
+    stock_ledger.release(msg.from_user.id)
     await msg.answer("❌ Заказ не отправлен. Вы можете начать заново.", reply_markup=kb)
     await state.clear()
 
@@ -658,14 +767,122 @@ async def handle_cancel_text(msg: types.Message, state: FSMContext):
 @dp.message(lambda message: message.text and message.text.lower() == "создать новый заказ")
 async def handle_new_order(msg: types.Message, state: FSMContext):
     init_order(msg.from_user.id)
+    stock_ledger.release(msg.from_user.id)
     await msg.answer("Начнём новый заказ!\nВведите ваше имя:", reply_markup=types.ReplyKeyboardRemove())
     await state.set_state(OrderState.manager)
 
 
+# ----------------- INLINE QUERY: поиск товара из любого чата -----------------
+def _available_stock(product):
+    available = stock_ledger.available(product["code"], product["stock"])
+    return product["stock"] if available is None else available
+
+
+@dp.inline_query()
+async def inline_product_search(query: types.InlineQuery):
+    """
+    @bot <часть названия или кода> — товары из кэша склада, без запросов к таблице.
+    Выбранный товар отправляется в чат своим кодом, поэтому на шаге
+    ввода кода его можно вставить прямо из inline-поиска.
+    Inline-режим должен быть включён у бота в @BotFather (/setinline).
+    """
+    text = query.query.strip()
+    offset = int(query.offset) if query.offset.isdigit() else 0
+    if len(text) < 2:
+        await query.answer([], cache_time=INLINE_CACHE_TIME, is_personal=False)
+        return
+
+    # Берём на один товар больше страницы — так узнаём, есть ли следующая
+    found = await catalog.search_by_name(text, limit=offset + INLINE_PAGE_SIZE + 1)
+    page = found[offset:offset + INLINE_PAGE_SIZE]
+    results = [
+        types.InlineQueryResultArticle(
+            # Строк с одним кодом (партий) может быть несколько, а id в ответе должны быть разными
+            id=f"{offset + i}:{product['code']}"[:64],
+            title=product["name"] or product["code"],
+            description=(
+                f"Код {product['code']} · остаток {_available_stock(product)} · "
+                f"{product['price_with_vat']} € с НДС"
+            ),
+            input_message_content=types.InputTextMessageContent(message_text=product["code"]),
+        )
+        for i, product in enumerate(page)
+    ]
+    next_offset = str(offset + INLINE_PAGE_SIZE) if len(found) > offset + INLINE_PAGE_SIZE else ""
+    await query.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=False, next_offset=next_offset)
+
+
 # ----------------- MAIN -----------------
+_background_tasks = []
+_metrics_runners = []
+_email_tasks = set()
+
+
+def _send_order_email_later(order):
+    """Письмо бухгалтеру уходит в фоне; остановка бота дожидается всех таких отправок."""
+    task = asyncio.create_task(submit_order_email(order))
+    _email_tasks.add(task)
+    task.add_done_callback(_email_tasks.discard)
+
+
+@dp.startup()
+async def on_startup(bot: Bot):
+    restore_drafts()
+    start_pdf_pool()
+    temp_orders_sync.start()
+    order_commits.start()
+    order_digest.start()
+    # Закрытые месяцы архива сжимаем, итоги продаж грузим заранее,
+    # чтобы первый /report не ждал прохода по архиву
+    _background_tasks.append(asyncio.create_task(asyncio.to_thread(rotate_archive)))
+    _background_tasks.append(asyncio.create_task(asyncio.to_thread(sales_reports.ensure_built)))
+    _background_tasks.append(asyncio.create_task(metrics.log_summary_periodically()))
+    if metrics.METRICS_PORT:
+        _metrics_runners.append(await metrics.start_metrics_server())
+    if RUN_MODE == "webhook":
+        if not WEBHOOK_BASE_URL:
+            raise ValueError("Для RUN_MODE=webhook нужен WEBHOOK_BASE_URL.")
+        await bot.set_webhook(f"{WEBHOOK_BASE_URL}{WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET)
+    else:
+        # Вебхук, оставшийся от прошлого запуска, мешает getUpdates
+        await bot.delete_webhook()
+
+
+@dp.shutdown()
+async def on_shutdown():
+    # FSM-хранилище закрывает сам Dispatcher
+    for task in _background_tasks:
+        task.cancel()
+    for runner in _metrics_runners:
+        await runner.cleanup()
+    await order_commits.stop()
+    await temp_orders_sync.stop()
+    # Письма подтверждённых заказов, которые ещё в пути, должны уйти до закрытия пула SMTP
+    await asyncio.gather(*_email_tasks, return_exceptions=True)
+    await order_digest.close()
+    await close_smtp_pool()
+    await close_drafts()
+    sales_reports.save()
+    shutdown_pdf_pool()
+
+
+def create_webhook_app() -> web.Application:
+    """aiohttp-приложение: POST на WEBHOOK_PATH передаёт апдейты в dp."""
+    # Без секрета любой, кто знает адрес, может слать боту поддельные апдейты
+    if not WEBHOOK_SECRET:
+        raise ValueError("Для RUN_MODE=webhook нужен WEBHOOK_SECRET.")
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
 async def main():
     await dp.start_polling(bot)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if RUN_MODE == "webhook":
+        web.run_app(create_webhook_app(), host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+    else:
+        asyncio.run(main())
@@ -0,0 +1,148 @@
+# metrics.py
+import asyncio
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Адрес и порт /metrics (0 — не поднимать сервер) и период сводки в лог.
+# Метрики отдаются только этим сервером, по умолчанию на localhost — в вебхук-приложении их нет
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_SUMMARY_INTERVAL = float(os.getenv("METRICS_SUMMARY_INTERVAL", "300"))
+
+# Границы корзин гистограмм, секунды
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Гистограмма длительностей в формате Prometheus (накопительные корзины)."""
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Оценка квантиля по корзинам (верхняя граница корзины)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+
+_lock = threading.Lock()
+_histograms = {}
+_gauges = {}
+
+
+def observe(name, seconds, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+
+def gauge(name, read, **labels):
+    """Текущее значение, которое читается при каждом запросе /metrics: gauge("queue_depth", lambda: len(q))."""
+    with _lock:
+        _gauges[(name, tuple(sorted(labels.items())))] = read
+
+
+@contextmanager
+def timer(name, **labels):
+    """Замер блока кода: with timer("dependency_seconds", dependency="sheets", op="stock_sync"): ..."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = []
+    for key, value in pairs:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        escaped.append(f'{key}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def render_text():
+    """Все гистограммы и gauge-метрики в текстовом формате Prometheus."""
+    with _lock:
+        items = sorted(_histograms.items())
+        gauges = sorted(_gauges.items())
+        lines = []
+        typed = set()
+        for (name, labels), h in items:
+            metric = f"alanika_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            cumulative = 0
+            for bound, count in zip(BUCKETS, h.counts):
+                cumulative += count
+                lines.append(f"{metric}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{metric}_bucket{_format_labels(labels, [('le', '+Inf')])} {h.count}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {h.sum:.6f}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {h.count}")
+    for (name, labels), read in gauges:
+        metric = f"alanika_{name}"
+        if metric not in typed:
+            lines.append(f"# TYPE {metric} gauge")
+            typed.add(metric)
+        lines.append(f"{metric}{_format_labels(labels)} {read()}")
+    return "\n".join(lines) + "\n"
+
+
+def summary_lines():
+    with _lock:
+        return [
+            f"{name}{_format_labels(labels)}: n={h.count} avg={h.sum / h.count * 1000:.1f}ms "
+            f"p50≈{h.quantile(0.5) * 1000:.0f}ms p99≈{h.quantile(0.99) * 1000:.0f}ms max={h.max * 1000:.1f}ms"
+            for (name, labels), h in sorted(_histograms.items()) if h.count
+        ]
+
+
+async def log_summary_periodically(interval=METRICS_SUMMARY_INTERVAL):
+    while True:
+        await asyncio.sleep(interval)
+        lines = summary_lines()
+        if lines:
+            print("📊 Задержки за время работы:\n" + "\n".join(lines))
+
+
+async def metrics_handler(request):
+    from aiohttp import web
+    return web.Response(text=render_text(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    """Отдельный aiohttp-сервер с /metrics (в обоих режимах запуска)."""
+    from aiohttp import web
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
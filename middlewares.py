@@ -0,0 +1,49 @@
+# middlewares.py
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from metrics import observe
+
+
+def _callback_name(data):
+    # select_product_3 -> select_product: номер варианта в метку не тащим
+    return re.sub(r"_\d+$", "", data or "") or "-"
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    """Время обработки каждого апдейта: сообщения — по состоянию FSM, колбэки — по имени."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if isinstance(event, CallbackQuery):
+            label = f"callback:{_callback_name(event.data)}"
+        elif isinstance(event, Message):
+            label = f"message:{data.get('raw_state') or '-'}"
+        else:
+            label = type(event).__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            observe("handler_seconds", time.perf_counter() - started, handler=label)
+
+
+class TelegramTimingMiddleware(BaseRequestMiddleware):
+    """Время каждого запроса к Bot API по имени метода."""
+
+    async def __call__(self, make_request, bot, method):
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            observe("dependency_seconds", time.perf_counter() - started,
+                    dependency="telegram", op=method.__api_method__)
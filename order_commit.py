@@ -0,0 +1,104 @@
+# order_commit.py
+import asyncio
+import copy
+import os
+
+# Сколько подтверждений самое большее пишется одной пачкой
+ORDER_COMMIT_MAX_BATCH = int(os.getenv("ORDER_COMMIT_MAX_BATCH", "256"))
+
+
+class OrderCommitPipeline:
+    """
+    Единственный писатель подтверждённых заказов.
+    Обработчики кладут заказ в очередь и ждут свой future; фоновая задача
+    забирает всё, что накопилось, и отдаёт пачку в write_batch([(user_id, order), ...])
+    в отдельном потоке — одна запись и один fsync на всю пачку.
+    Пока предыдущая пачка пишется, следующая копится в очереди.
+    Future получают результат сразу после записи; on_commit(сохранённые копии) вызывается
+    уже после этого, и его ошибка не превращает записанные заказы в неудачу.
+    """
+
+    def __init__(self, write_batch, max_batch=ORDER_COMMIT_MAX_BATCH, on_commit=None):
+        self._write_batch = write_batch
+        self._on_commit = on_commit
+        self.max_batch = max_batch
+        self._queue = None
+        self._task = None
+        self.batches = 0
+        self.committed = 0
+        self.max_batch_seen = 0
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Дописывает всё, что уже в очереди, и останавливает задачу."""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, user_id, order):
+        """Ставит заказ в очередь и ждёт, пока он надёжно записан. Возвращает сохранённую копию."""
+        # Копия: черновик в памяти может меняться, пока заказ ждёт записи
+        order = copy.deepcopy(order)
+        if self._task is None:
+            # Пайплайн не запущен (скрипты, тесты вне Dispatcher) — пишем сразу
+            archived = await asyncio.to_thread(self._write_batch, [(user_id, order)])
+            self._after_commit(archived)
+            return archived[0]
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((user_id, order, future))
+        return await future
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            item = await self._queue.get()
+            while True:
+                if item is None:
+                    stopping = True
+                else:
+                    batch.append(item)
+                if len(batch) >= self.max_batch or self._queue.empty():
+                    break
+                item = self._queue.get_nowait()
+            if batch:
+                await self._commit(batch)
+
+    async def _commit(self, batch):
+        try:
+            archived = await asyncio.to_thread(self._write_batch, [(user_id, order) for user_id, order, _ in batch])
+        except Exception as e:
+            print(f"❌ Ошибка записи {len(batch)} подтверждённых заказов:", e)
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.committed += len(batch)
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        for (_, _, future), order_copy in zip(batch, archived):
+            if not future.done():
+                future.set_result(order_copy)
+        self._after_commit(archived)
+
+    def _after_commit(self, archived):
+        if self._on_commit is None:
+            return
+        try:
+            self._on_commit(archived)
+        except Exception as e:
+            print("❌ Ошибка обработки записанных заказов:", e)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "committed": self.committed,
+            "max_batch": self.max_batch_seen,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+        }
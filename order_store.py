@@ -0,0 +1,185 @@
+# order_store.py
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS drafts (
+    user_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS archived_orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT,
+    manager TEXT,
+    client TEXT,
+    timestamp TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS order_lines (
+    order_id INTEGER NOT NULL REFERENCES archived_orders(id) ON DELETE CASCADE,
+    line_no INTEGER NOT NULL,
+    code TEXT,
+    name TEXT,
+    qty INTEGER,
+    sum_no_vat REAL,
+    sum_with_vat REAL,
+    PRIMARY KEY (order_id, line_no)
+);
+CREATE INDEX IF NOT EXISTS idx_archived_orders_manager ON archived_orders(manager);
+CREATE INDEX IF NOT EXISTS idx_archived_orders_client ON archived_orders(client);
+CREATE INDEX IF NOT EXISTS idx_archived_orders_timestamp ON archived_orders(timestamp);
+CREATE INDEX IF NOT EXISTS idx_order_lines_code ON order_lines(code);
+"""
+
+
+class SQLiteOrderStore:
+    """
+    Хранилище черновиков и архива заказов в SQLite (режим WAL).
+    Соединение своё у каждого потока: функции orders.py зовут и из
+    обработчиков, и через asyncio.to_thread.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    # ---------- черновики ----------
+    def load_drafts(self):
+        rows = self._conn().execute("SELECT user_id, data FROM drafts").fetchall()
+        return {user_id: json.loads(data) for user_id, data in rows}
+
+    def save_drafts(self, drafts):
+        """Полностью заменяет набор черновиков (совместимость с save_orders)."""
+        conn = self._conn()
+        now = datetime.now().isoformat()
+        with conn:
+            conn.execute("DELETE FROM drafts")
+            conn.executemany(
+                "INSERT INTO drafts (user_id, data, updated_at) VALUES (?, ?, ?)",
+                [(str(user_id), json.dumps(order, ensure_ascii=False), now) for user_id, order in drafts.items()]
+            )
+
+    def save_draft(self, user_id, order):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO drafts (user_id, data, updated_at) VALUES (?, ?, ?)",
+                (str(user_id), json.dumps(order, ensure_ascii=False), datetime.now().isoformat())
+            )
+
+    def write_drafts(self, changes):
+        """Изменения черновиков одной транзакцией: {user_id: заказ или None — удалить}."""
+        conn = self._conn()
+        now = datetime.now().isoformat()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO drafts (user_id, data, updated_at) VALUES (?, ?, ?)",
+                [(str(user_id), json.dumps(order, ensure_ascii=False), now)
+                 for user_id, order in changes.items() if order is not None]
+            )
+            conn.executemany(
+                "DELETE FROM drafts WHERE user_id = ?",
+                [(str(user_id),) for user_id, order in changes.items() if order is None]
+            )
+
+    def delete_draft(self, user_id):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM drafts WHERE user_id = ?", (str(user_id),))
+
+    # ---------- архив ----------
+    def _insert_archived(self, conn, order, user_id=None):
+        cur = conn.execute(
+            "INSERT INTO archived_orders (user_id, manager, client, timestamp, data) VALUES (?, ?, ?, ?, ?)",
+            (
+                str(user_id) if user_id is not None else None,
+                order.get("manager", ""),
+                order.get("client", ""),
+                order.get("timestamp", ""),
+                json.dumps(order, ensure_ascii=False),
+            )
+        )
+        conn.executemany(
+            "INSERT INTO order_lines (order_id, line_no, code, name, qty, sum_no_vat, sum_with_vat) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (cur.lastrowid, line_no, p.get("code"), p.get("name"), p.get("qty"),
+                 p.get("sum_no_vat"), p.get("sum_with_vat"))
+                for line_no, p in enumerate(order.get("products", []), 1)
+            ]
+        )
+
+    def archive_order(self, order, user_id=None):
+        """
+        Одна транзакция: заказ и его строки в архив, черновик пользователя удаляется.
+        Возвращает сохранённую копию заказа с timestamp.
+        """
+        return self.archive_orders([(user_id, order)])[0]
+
+    def archive_orders(self, batch):
+        """То же для пачки [(user_id, order), ...] одной транзакцией; копии — в том же порядке."""
+        now = datetime.now().isoformat()
+        copies = [dict(order, timestamp=now) for _, order in batch]
+        conn = self._conn()
+        with conn:
+            for (user_id, _), order_copy in zip(batch, copies):
+                self._insert_archived(conn, order_copy, user_id)
+                if user_id is not None:
+                    conn.execute("DELETE FROM drafts WHERE user_id = ?", (str(user_id),))
+        return copies
+
+    def import_archive(self, orders):
+        """Переносит заказы из файлового архива. Возвращает число перенесённых."""
+        conn = self._conn()
+        count = 0
+        with conn:
+            for order in orders:
+                self._insert_archived(conn, order)
+                count += 1
+        return count
+
+    def archive_revision(self):
+        """Последний id архива: растёт с каждой записью (AUTOINCREMENT не переиспользует id), O(log n)."""
+        return self._conn().execute("SELECT MAX(id) FROM archived_orders").fetchone()[0] or 0
+
+    def find_archived(self, client=None, manager=None, date_from=None, date_to=None):
+        """Поиск по индексам client/manager/timestamp; даты — префиксы ISO, включительно."""
+        conditions, params = [], []
+        if client is not None:
+            conditions.append("client = ?")
+            params.append(client)
+        if manager is not None:
+            conditions.append("manager = ?")
+            params.append(manager)
+        if date_from is not None:
+            conditions.append("timestamp >= ?")
+            params.append(date_from)
+        if date_to is not None:
+            # "2025-08" включает весь месяц: всё, что начинается с префикса
+            conditions.append("timestamp < ?")
+            params.append(date_to + "\uffff")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        cur = self._conn().execute(f"SELECT data FROM archived_orders {where} ORDER BY id", params)
+        return [json.loads(data) for (data,) in cur]
+
+    def archive_is_empty(self):
+        return self._conn().execute("SELECT 1 FROM archived_orders LIMIT 1").fetchone() is None
+
+    def iter_archive(self):
+        cur = self._conn().execute("SELECT data FROM archived_orders ORDER BY id")
+        for (data,) in cur:
+            yield json.loads(data)
@@ -1,20 +1,23 @@
 # orders.py
+import asyncio
+import copy
 import json
+import os
+import threading
 from datetime import datetime
 from typing import Dict, Any
 from config import EMAIL_SENDER, EMAIL_PASSWORD, EMAIL_RECIPIENT
-from email_module import send_email_with_pdf
-from fpdf import FPDF
-
-pdf = FPDF()
-pdf.add_page()
-
-pdf.add_font('DejaVu', '', 'DejaVuSans.ttf', uni=True)
-pdf.set_font('DejaVu', '', 14)
-
-pdf.cell(40, 10, 'Текст на русском и английском')
-
-pdf.output('order.pdf')
+from email_module import (
+    send_email_with_pdf, render_pdf_async, build_order_message,
+    render_digest_pdf_async, build_digest_message
+)
+from digest import OrderDigest, EMAIL_DIGEST_ENABLED, is_urgent
+from order_commit import OrderCommitPipeline
+from email_transport import SMTPPool
+from order_store import SQLiteOrderStore
+from metrics import timer
+from reports import SalesReports, REPORTS_FILE
+from archive import OrderArchive, ARCHIVE_DIR, read_archive_file
 
 
 _orders = {}
@@ -28,18 +31,100 @@ def init_order(user_id):
         "delivery_date": "",
         "delivery_address": ""
     }
+    _mark_draft_dirty(user_id)
 
 def update_order(user_id, key, value):
     user_key = str(user_id)
     if user_key not in _orders:
         init_order(user_id)
     _orders[user_key][key] = value
+    _mark_draft_dirty(user_id)
 
 def get_order(user_id):
     return _orders.get(str(user_id), {})
 
+def drop_order(user_id):
+    """Убирает черновик подтверждённого заказа из памяти; с диска он уйдёт при следующем сбросе."""
+    if _orders.pop(str(user_id), None) is not None:
+        _mark_draft_dirty(user_id)
+
+def restore_drafts():
+    """Поднимает незавершённые заказы после перезапуска бота."""
+    _orders.update(load_orders())
+
+def save_drafts():
+    """Сохраняет все незавершённые заказы разом (для скриптов вне event loop)."""
+    save_orders(_orders)
+
+# Черновики пишутся на диск так же, как FSM-сессии (fsm_storage.SQLiteStorage):
+# изменённые черновики сбрасываются пачкой раз в DRAFTS_FLUSH_INTERVAL секунд и при остановке
+DRAFTS_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "1.0"))
+_dirty_drafts = set()
+_drafts_flush_task = None
+_drafts_flush_lock = asyncio.Lock()
+_drafts_closing = asyncio.Event()
+
+def _mark_draft_dirty(user_id):
+    global _drafts_flush_task
+    _dirty_drafts.add(str(user_id))
+    if _drafts_closing.is_set():
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return  # Вне event loop черновики сохраняет save_drafts()
+    if _drafts_flush_task is None or _drafts_flush_task.done():
+        _drafts_flush_task = loop.create_task(_drafts_flush_loop())
+
+async def _drafts_flush_loop():
+    while _dirty_drafts and not _drafts_closing.is_set():
+        try:
+            await asyncio.wait_for(_drafts_closing.wait(), DRAFTS_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        await flush_drafts()
+
+async def flush_drafts():
+    """Записывает черновики, изменённые с прошлого сброса."""
+    async with _drafts_flush_lock:
+        if not _dirty_drafts:
+            return
+        changes = {user_id: copy.deepcopy(_orders.get(user_id)) for user_id in _dirty_drafts}
+        _dirty_drafts.clear()
+        try:
+            await asyncio.to_thread(write_drafts, changes)
+        except Exception as e:
+            # Попробуем при следующем сбросе
+            _dirty_drafts.update(changes)
+            print("❌ Ошибка сохранения черновиков:", e)
+
+async def close_drafts():
+    """Останавливает отложенную запись и сбрасывает оставшиеся черновики."""
+    _drafts_closing.set()
+    if _drafts_flush_task is not None:
+        await _drafts_flush_task
+    await flush_drafts()
+
+def write_drafts(changes):
+    """Применяет изменения черновиков {user_id: заказ или None — удалить}."""
+    store = get_order_store()
+    if store:
+        store.write_drafts(changes)
+        return
+    orders = load_orders()
+    for user_id, order in changes.items():
+        if order is None:
+            orders.pop(user_id, None)
+        else:
+            orders[user_id] = order
+    save_orders(orders)
+
 def save_user_order_state(user_id, order):
     """Сохраняет заказ конкретного пользователя в файл ORDERS_FILE."""
+    store = get_order_store()
+    if store:
+        store.save_draft(user_id, order)
+        return
     orders = load_orders()
     orders[str(user_id)] = order
     save_orders(orders)
@@ -55,26 +140,228 @@ def send_order_email(order: Dict[str, Any]):
     # Вызов реальной функции отправки
     send_email_with_pdf(order, EMAIL_SENDER, EMAIL_PASSWORD, EMAIL_RECIPIENT)
 
+_smtp_pool = None
+
+def get_smtp_pool():
+    """Общий пул SMTP-сессий отправителя EMAIL_SENDER."""
+    global _smtp_pool
+    if _smtp_pool is None:
+        _smtp_pool = SMTPPool(EMAIL_SENDER, EMAIL_PASSWORD)
+    return _smtp_pool
+
+async def close_smtp_pool():
+    global _smtp_pool
+    if _smtp_pool is not None:
+        await _smtp_pool.close()
+        _smtp_pool = None
+
+async def send_order_email_async(order: Dict[str, Any]):
+    """
+    Асинхронный вариант: PDF рендерится в пуле процессов (PDF_WORKERS),
+    письмо уходит через пул SMTP-сессий без отдельного потока.
+    """
+    if not order or not order.get("products"):
+        raise ValueError("Order empty or has no products")
+    try:
+        pdf_bytes = await render_pdf_async(order)
+        msg = build_order_message(order, EMAIL_SENDER, EMAIL_RECIPIENT, pdf_bytes)
+        await get_smtp_pool().send(msg)
+        print("📨 Email с PDF отправлен успешно")
+    except Exception as e:
+        print("❌ Ошибка при отправке письма:", e)
+        raise
+
+async def send_digest_email_async(orders):
+    """Одно письмо с общим PDF на пачку заказов."""
+    pdf_bytes = await render_digest_pdf_async(orders)
+    msg = build_digest_message(orders, EMAIL_SENDER, EMAIL_RECIPIENT, pdf_bytes)
+    await get_smtp_pool().send(msg)
+    print(f"📨 Сводка из {len(orders)} заказов отправлена")
+
+order_digest = OrderDigest(send_digest_email_async)
+
+async def submit_order_email(order: Dict[str, Any]):
+    """
+    Отправка подтверждённого заказа бухгалтеру. В режиме сводки (EMAIL_DIGEST=1)
+    заказ копится в order_digest, срочные заказы уходят сразу.
+    """
+    if EMAIL_DIGEST_ENABLED and not is_urgent(order):
+        await order_digest.add(dict(order))
+        return
+    await send_order_email_async(order)
+
 # Архивация
-ARCHIVE_FILE = "orders_archive.json"
+# Архив — месячные сегменты JSON Lines в ARCHIVE_DIR с индексом смещений (archive.py).
+# Старые форматы (единый JSONL и JSON-массив) переносятся в сегменты при первом обращении
+ARCHIVE_FILE = "orders_archive.jsonl"
+LEGACY_ARCHIVE_FILE = "orders_archive.json"
 ORDERS_FILE = "orders_data.json"
+_order_archive = None
+_migrate_lock = threading.Lock()
+_archive_lock = threading.Lock()
+
+def get_order_archive():
+    global _order_archive
+    # Первым архив могут запросить сразу два потока старта (rotate_archive и итоги продаж)
+    with _archive_lock:
+        if _order_archive is None:
+            _order_archive = OrderArchive(ARCHIVE_DIR)
+        return _order_archive
+
+# Хранилище: "json" — файлы выше, "sqlite" — база ORDERS_DB (order_store.py)
+ORDERS_BACKEND = os.getenv("ORDERS_BACKEND", "json")
+ORDERS_DB = os.getenv("ORDERS_DB", "orders.db")
+_order_store = None
+
+def get_order_store():
+    """SQLiteOrderStore при ORDERS_BACKEND=sqlite, иначе None."""
+    global _order_store
+    if ORDERS_BACKEND != "sqlite":
+        return None
+    if _order_store is None:
+        _order_store = SQLiteOrderStore(ORDERS_DB)
+    return _order_store
+
+def confirm_order(user_id, order):
+    """Архивирует подтверждённый заказ и удаляет черновик пользователя."""
+    return confirm_orders([(user_id, order)])[0]
+
+def confirm_orders(batch):
+    """
+    Пачка подтверждений [(user_id, order), ...] одной записью в архив (archive_confirmed),
+    затем итоги продаж. Возвращает сохранённые копии заказов с timestamp в том же порядке.
+    """
+    archived = archive_confirmed(batch)
+    record_sales(archived)
+    return archived
+
+def archive_confirmed(batch):
+    """
+    Надёжная запись пачки подтверждений: один fsync на сегмент или одна транзакция SQLite.
+    Черновики здесь не переписываются — их убирает drop_order через отложенную запись.
+    """
+    with timer("dependency_seconds", dependency="archive", op="confirm"):
+        migrate_archive()
+        store = get_order_store()
+        if store:
+            return store.archive_orders(batch)
+        now = datetime.now().isoformat()
+        archived = [dict(order, timestamp=now) for _, order in batch]
+        get_order_archive().append_many(archived)
+        return archived
+
+def record_sales(archived):
+    """Добавляет уже записанные заказы в итоги продаж; ошибка здесь не отменяет сохранённые заказы."""
+    try:
+        for order_copy in archived:
+            sales_reports.add(order_copy)
+    except Exception as e:
+        print("❌ Ошибка обновления итогов продаж:", e)
 
 def write_order_to_archive(order):
-    archive = load_orders_archive()
+    migrate_archive()
+    store = get_order_store()
+    if store:
+        sales_reports.add(store.archive_order(order))
+        return
     order_copy = dict(order)
     order_copy["timestamp"] = datetime.now().isoformat()
-    archive.append(order_copy)
-    with open(ARCHIVE_FILE, "w", encoding="utf-8") as f:
-        json.dump(archive, f, ensure_ascii=False, indent=2)
+    get_order_archive().append(order_copy)
+    sales_reports.add(order_copy)
 
-def load_orders_archive():
+def iter_orders_archive():
+    """Построчно отдаёт заказы из архива, не загружая файл целиком."""
+    migrate_archive()
+    store = get_order_store()
+    if store:
+        yield from store.iter_archive()
+        return
+    yield from get_order_archive().iter_orders()
+
+def find_archived_orders(client=None, manager=None, date_from=None, date_to=None):
+    """
+    Заказы архива по клиенту, менеджеру и/или периоду ("2025-08", "2025-08-01", включительно).
+    Читаются только найденные заказы: по индексу сегментов или индексам SQLite.
+    """
+    migrate_archive()
+    store = get_order_store()
+    if store:
+        return store.find_archived(client, manager, date_from, date_to)
+    return get_order_archive().find(client, manager, date_from, date_to)
+
+def rotate_archive():
+    """Сжимает сегменты закрытых месяцев. Вызывается при старте бота."""
+    if get_order_store():
+        return []
+    migrate_archive()
+    return get_order_archive().rotate()
+
+def archive_marker():
+    """Меняется при каждой записи в архив: по нему отчёты понимают, что итоги устарели."""
+    store = get_order_store()
+    if store:
+        return f"sqlite:{store.archive_revision()}"
     try:
-        with open(ARCHIVE_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return f"segments:{os.path.getsize(get_order_archive().index_path)}"
     except FileNotFoundError:
-        return []
+        return "segments:0"
+
+# Дневные итоги продаж для /report (reports.py)
+sales_reports = SalesReports(REPORTS_FILE, iter_orders_archive, archive_marker)
+
+# Подтверждения заказов пишет одна фоновая задача пачками (order_commit.py);
+# обработчики получают ответ сразу после записи, итоги продаж обновляются следом
+order_commits = OrderCommitPipeline(archive_confirmed, on_commit=record_sales)
+
+def load_orders_archive():
+    """Старый интерфейс: весь архив списком. Для больших архивов — iter_orders_archive()."""
+    return list(iter_orders_archive())
+
+def migrate_archive():
+    """
+    Однократно переносит старый архив (orders_archive.jsonl или JSON-массив
+    orders_archive.json) в месячные сегменты ARCHIVE_DIR. Старые файлы не удаляются.
+    Возвращает число перенесённых заказов.
+    При ORDERS_BACKEND=sqlite файловый архив переносится в пустую базу.
+    """
+    # При старте rotate_archive и пересчёт итогов идут в разных потоках —
+    # без блокировки оба увидят пустой архив и перенесут его дважды
+    with _migrate_lock:
+        return _migrate_archive()
+
+def _migrate_archive():
+    store = get_order_store()
+    if store:
+        if not store.archive_is_empty():
+            return 0
+        count = store.import_archive(_iter_file_archive())
+        if count:
+            print(f"📦 Архив перенесён в {ORDERS_DB}: {count} заказов")
+        return count
+    archive = get_order_archive()
+    if archive.exists():
+        return 0
+    source = next((path for path in (ARCHIVE_FILE, LEGACY_ARCHIVE_FILE) if os.path.exists(path)), None)
+    if source is None:
+        return 0
+    count = archive.import_orders(read_archive_file(source))
+    print(f"📦 Архив {source} перенесён в {ARCHIVE_DIR}: {count} заказов")
+    return count
+
+def _iter_file_archive():
+    archive = get_order_archive()
+    if archive.exists():
+        yield from archive.iter_orders()
+        return
+    for path in (ARCHIVE_FILE, LEGACY_ARCHIVE_FILE):
+        if os.path.exists(path):
+            yield from read_archive_file(path)
+            return
 
 def load_orders():
+    store = get_order_store()
+    if store:
+        return store.load_drafts()
     try:
         with open(ORDERS_FILE, "r", encoding="utf-8") as f:
             return json.load(f)
@@ -82,6 +369,10 @@ def load_orders():
         return {}
 
 def save_orders(orders):
+    store = get_order_store()
+    if store:
+        store.save_drafts(orders)
+        return
     with open(ORDERS_FILE, "w", encoding="utf-8") as f:
         json.dump(orders, f, ensure_ascii=False, indent=2)
 
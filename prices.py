@@ -0,0 +1,54 @@
+# prices.py
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import lru_cache
+
+# Цены хранятся в целых центах: строка из таблицы разбирается один раз при загрузке склада,
+# суммы строк считаются целочисленным умножением
+
+
+@lru_cache(maxsize=4096)
+def parse_cents(value):
+    """
+    Цена из таблицы ("4,25", 4.25, "1 200,50") в целых центах; None — пустая или нечисловая ячейка.
+    Различных цен на складе немного, поэтому разобранные значения кэшируются.
+    """
+    text = str(value).strip().replace(",", ".").replace(" ", "").replace("\xa0", "")
+    if not text:
+        return None
+    whole, _, fraction = text.partition(".")
+    if whole.isdigit() and len(fraction) <= 2 and (fraction.isdigit() or not fraction):
+        return int(whole) * 100 + int(fraction.ljust(2, "0"))
+    try:
+        return int((Decimal(text) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    except InvalidOperation:
+        return None
+
+
+@lru_cache(maxsize=4096)
+def format_cents(cents):
+    """425 -> "4.25"; None -> "" (как пустая ячейка). Одна строка на все товары с этой ценой."""
+    if cents is None:
+        return ""
+    sign = "-" if cents < 0 else ""
+    return f"{sign}{abs(cents) // 100}.{abs(cents) % 100:02d}"
+
+
+def price_cents(item, key):
+    """
+    Цена товара или строки заказа в центах: поле key + "_cents" из каталога,
+    а у черновиков, сохранённых до перехода на центы, — разбор строки key.
+    None — цены в таблице нет или она нечисловая (это не 0 €).
+    """
+    cents = item.get(key + "_cents")
+    if cents is None:
+        cents = parse_cents(item.get(key, ""))
+    return cents
+
+
+def line_totals(item, qty):
+    """(сумма без НДС, сумма с НДС) строки в евро; None, если у товара нет корректной цены."""
+    no_vat = price_cents(item, "price_no_vat")
+    with_vat = price_cents(item, "price_with_vat")
+    if no_vat is None or with_vat is None:
+        return None
+    return no_vat * qty / 100, with_vat * qty / 100
@@ -1,6 +1,18 @@
+import asyncio
+import hashlib
+import heapq
+import os
+import re
+import sys
+import threading
+import time
+
 import gspread
 from google.oauth2.service_account import Credentials
 
+from metrics import timer
+from prices import parse_cents, format_cents
+
 # Подключаемся к Google Sheets
 scopes = [
     "https://www.googleapis.com/auth/spreadsheets",
@@ -8,35 +20,454 @@ scopes = [
     "https://www.googleapis.com/auth/drive"
 ]
 
-# Используем правильное имя файла ключа
-creds = Credentials.from_service_account_file('google_credentials.json', scopes=scopes)
-gc = gspread.authorize(creds)
+_worksheet = None
 
-# Открываем таблицу и лист
-sheet = gc.open_by_url("https://docs.google.com/spreadsheets/d/1UcxQORwPy4AiYL4a9qrrhPI78OOB0mxMOjJXX-PfLZ4/edit")
-worksheet = sheet.worksheet("stock1")  # <- название листа
 
-def get_products():
-    records = worksheet.get_all_records()
-    products = []
+def get_worksheet():
+    """Лист склада; авторизация и открытие таблицы — при первом обращении, не при импорте."""
+    global _worksheet
+    if _worksheet is None:
+        # Используем правильное имя файла ключа
+        creds = Credentials.from_service_account_file('google_credentials.json', scopes=scopes)
+        gc = gspread.authorize(creds)
+
+        # Открываем таблицу и лист
+        sheet = gc.open_by_url("https://docs.google.com/spreadsheets/d/1UcxQORwPy4AiYL4a9qrrhPI78OOB0mxMOjJXX-PfLZ4/edit")
+        _worksheet = sheet.worksheet("stock1")  # <- название листа
+    return _worksheet
+
+# Как часто (в секундах) перечитывать склад из таблицы
+CATALOG_TTL = int(os.getenv("CATALOG_TTL", "300"))
+SUFFIX_LEN = 4
+# Сколько товаров отдаёт поиск по названию
+SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", "10"))
+# Если запрос совпал с большим числом товаров, ранжируем только
+# самые короткие названия из подходящих (порядок считается при обновлении склада)
+SEARCH_BROAD = 200
+# Сколько товаров просматривать по порядку длины, прежде чем пересекать триграммы целиком
+SEARCH_SCAN_BUDGET = 3000
+
+
+class Product:
+    """
+    Строка склада в кэше каталога. Без __dict__ (__slots__), цены — целые центы,
+    код, "Товар" и срок годности интернированы, а строки цен для показа общие
+    у всех товаров с той же ценой (format_cents): на 100k строк это заметно меньше
+    памяти, чем словарь со своими строками цен у каждого товара.
+    Обработчикам и FSM отдаётся словарь as_dict().
+    """
+
+    __slots__ = ("code", "extra_code", "name", "stock", "expiry", "price_no_vat_cents", "price_with_vat_cents",
+                 "price_no_vat", "price_with_vat")
+
+    def __init__(self, code, extra_code, name, stock, expiry, price_no_vat_cents, price_with_vat_cents):
+        self.code = code
+        self.extra_code = extra_code
+        self.name = name
+        self.stock = stock
+        self.expiry = expiry
+        self.price_no_vat_cents = price_no_vat_cents
+        self.price_with_vat_cents = price_with_vat_cents
+        self.price_no_vat = format_cents(price_no_vat_cents)
+        self.price_with_vat = format_cents(price_with_vat_cents)
+
+    def _key(self):
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __eq__(self, other):
+        return isinstance(other, Product) and self._key() == other._key()
+
+    def as_dict(self):
+        return {
+            "code": self.code,
+            "extra_code": self.extra_code,
+            "name": self.name,
+            "stock": self.stock,
+            "expiry": self.expiry,
+            "price_no_vat": self.price_no_vat,
+            "price_with_vat": self.price_with_vat,
+            "price_no_vat_cents": self.price_no_vat_cents,
+            "price_with_vat_cents": self.price_with_vat_cents,
+        }
+
+
+def _row_keys(products):
+    """
+    (ключ, товар) для строк листа: "Код" для первой строки с этим кодом,
+    "Код#2", "Код#3"... для следующих. Ключ не меняется, если строки
+    с другими кодами добавили или удалили выше.
+    """
+    seen = {}
+    for product in products:
+        n = seen.get(product.code, 0) + 1
+        seen[product.code] = n
+        yield (product.code if n == 1 else sys.intern(f"{product.code}#{n}")), product
+
+
+def _row_to_product(row):
+    return Product(
+        code=sys.intern(str(row.get("Код", "")).strip()),
+        extra_code=sys.intern(str(row.get("Товар", "")).strip()),
+        name=row.get("Наименование", ""),
+        stock=row.get("Остаток", 0),
+        expiry=sys.intern(str(row.get("Срок годности", ""))),
+        price_no_vat_cents=parse_cents(row.get("Цена без НДС", "")),
+        price_with_vat_cents=parse_cents(row.get("Цена с НДС", "")),
+    )
+
+
+def read_products():
+    """Читает весь лист stock1 из Google Sheets (сетевой запрос)."""
+    return [_row_to_product(row).as_dict() for row in get_worksheet().get_all_records()]
+
+
+def sheet_revision(ws):
+    """
+    Дешёвая проверка изменений: время последней правки таблицы из Drive API.
+    None — ревизия недоступна, тогда изменения ищем по хэшу содержимого.
+    """
+    spreadsheet = getattr(ws, "spreadsheet", None)
+    if spreadsheet is None or not hasattr(spreadsheet, "get_lastUpdateTime"):
+        return None
+    try:
+        return spreadsheet.get_lastUpdateTime()
+    except Exception as e:
+        print("⚠️ Не удалось получить ревизию таблицы:", e)
+        return None
+
+
+def _records_digest(records):
+    # Хэш построчно: repr всего листа одним вызовом держит GIL и останавливает event loop
+    digest = hashlib.sha1()
     for row in records:
-        product = {
-            "code": str(row.get("Код", "")).strip(),
-            "extra_code": str(row.get("Товар", "")).strip(),
-            "name": row.get("Наименование", ""),
-            "stock": row.get("Остаток", 0),
-            "expiry": row.get("Срок годности", ""),
-            "price_no_vat": str(row.get("Цена без НДС", "")).replace(",", "."),
-            "price_with_vat": str(row.get("Цена с НДС", "")).replace(",", ".")
+        digest.update(repr(row).encode("utf-8"))
+    return digest.hexdigest()
+
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize_search_text(text):
+    """Нижний регистр, ё -> е, всё, кроме букв и цифр, — пробелы."""
+    return _NON_WORD.sub(" ", str(text).casefold().replace("ё", "е")).strip()
+
+
+def _word_trigrams(word):
+    # Слово дополняется пробелами, как в pg_trgm: триграммы начала слова
+    # позволяют искать по префиксу из 1-2 символов
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _query_trigrams(word):
+    # Для запроса берём только внутренние триграммы: "long" найдёт "oolong",
+    # а недописанное "oolo" — "oolong"
+    if len(word) == 1:
+        return {f"  {word}"}
+    if len(word) == 2:
+        return {f" {word}"}
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+def _search_key(text, query, words):
+    """Ключ ранжирования: меньше — выше в выдаче."""
+    if text.startswith(query):
+        rank = 0
+    elif all(f" {word}" in f" {text}" for word in words):
+        rank = 1  # каждое слово запроса — начало слова в названии
+    elif query in text:
+        rank = 2
+    else:
+        rank = 3
+    position = text.find(words[0])
+    return rank, position if position >= 0 else len(text), len(text)
+
+
+class ProductCatalog:
+    """
+    Кэш склада в памяти с индексами:
+    последние 4 цифры кода -> товары, полный код -> товары, extra_code -> товары,
+    триграммы названия/кода/"Товар" -> ключи строк (поиск по части названия).
+    Код в листе не уникален (партии с разным сроком годности, строки без кода),
+    поэтому строка склада определяется ключом "Код" + номер строки с этим кодом (_row_keys).
+    Первый запрос грузит лист синхронно, дальше устаревший кэш
+    обновляется в фоновом потоке, а поиск отвечает из памяти.
+    Обновление инкрементальное: строки сравниваются по ключу, в индекс триграмм
+    попадают только добавленные, изменённые и удалённые строки. Индексы по коду
+    собираются заново в порядке листа (O(n), без копирования списков) вне блокировки
+    и подменяются под ней одним присваиванием — поиск никогда не ждёт синхронизацию.
+    """
+
+    def __init__(self, get_worksheet, ttl=CATALOG_TTL):
+        self._get_worksheet = get_worksheet
+        self.ttl = ttl
+        # _lock — только подмена индексов, _sync_lock — синхронизации по одной,
+        # _refresh_lock — флаг фонового обновления (его берёт event loop)
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+        self._inflight = None
+        self._loaded_at = None
+        self._revision = None
+        self._digest = None
+        self._rows = {}
+        self._by_code = {}
+        self._by_suffix = {}
+        self._by_extra_code = {}
+        self._by_trigram = {}
+        self._search_text = {}
+        self._by_length = []
+        self._length_rank = {}
+        self._sync_listeners = []
+        self.last_sync = None
+
+    def on_sync(self, callback):
+        """callback({код: [остатки строк с этим кодом]}) вызывается после каждого обновления, изменившего склад."""
+        self._sync_listeners.append(callback)
+
+    def refresh(self):
+        """Синхронизирует кэш с таблицей, возвращает статистику изменений."""
+        return self.sync()
+
+    def sync(self):
+        """
+        Проверяет, менялся ли лист, и применяет к кэшу только разницу.
+        Возвращает {"inserted": n, "updated": n, "deleted": n, "unchanged": bool}.
+        """
+        with timer("dependency_seconds", dependency="sheets", op="stock_sync"):
+            return self._sync()
+
+    def _sync(self):
+        with self._sync_lock:
+            ws = self._get_worksheet()
+            revision = sheet_revision(ws)
+            if revision is not None and revision == self._revision:
+                return self._mark_synced(0, 0, 0, unchanged=True)
+
+            records = ws.get_all_records()
+            digest = _records_digest(records)
+            if digest == self._digest:
+                self._revision = revision
+                return self._mark_synced(0, 0, 0, unchanged=True)
+
+            fresh = dict(_row_keys(_row_to_product(row) for row in records))
+            return self._apply(fresh, revision, digest)
+
+    def _apply(self, fresh, revision, digest):
+        rows = self._rows
+        inserted = updated = 0
+        for key, product in fresh.items():
+            old = rows.get(key)
+            if old is None:
+                inserted += 1
+            elif old != product:
+                updated += 1
+                self._unindex_text(key)
+            else:
+                continue
+            self._index_text(key, product)
+        deleted = [key for key in rows if key not in fresh]
+        for key in deleted:
+            self._unindex_text(key)
+
+        # Индексы по коду — заново в порядке листа: партии одного кода идут,
+        # как в таблице, и после правки любой строки
+        by_code, by_suffix, by_extra_code = {}, {}, {}
+        for product in fresh.values():
+            by_code.setdefault(product.code, []).append(product)
+            by_suffix.setdefault(product.code[-SUFFIX_LEN:], []).append(product)
+            if product.extra_code:
+                by_extra_code.setdefault(product.extra_code, []).append(product)
+        by_length, length_rank = self._by_length, self._length_rank
+        if inserted or updated or deleted:
+            texts = self._search_text
+            by_length = sorted(texts, key=lambda k: (len(texts[k]), texts[k]))
+            length_rank = {key: rank for rank, key in enumerate(by_length)}
+
+        with self._lock:
+            self._rows = fresh
+            self._by_code, self._by_suffix, self._by_extra_code = by_code, by_suffix, by_extra_code
+            self._by_length, self._length_rank = by_length, length_rank
+            self._revision = revision
+            self._digest = digest
+
+        if inserted or updated or deleted:
+            stocks = {}
+            for product in fresh.values():
+                stocks.setdefault(product.code, []).append(product.stock)
+            for callback in self._sync_listeners:
+                callback(stocks)
+        return self._mark_synced(inserted, updated, len(deleted))
+
+    def _index_text(self, key, product):
+        # Множества триграмм меняются на месте: поиск читает их только
+        # атомарными операциями (in, intersection, list) и не ломается от фонового обновления
+        text = normalize_search_text(f"{product.name} {product.extra_code} {product.code}")
+        self._search_text[key] = text
+        for word in text.split():
+            for trigram in _word_trigrams(word):
+                self._by_trigram.setdefault(trigram, set()).add(key)
+
+    def _unindex_text(self, key):
+        for word in self._search_text.pop(key, "").split():
+            for trigram in _word_trigrams(word):
+                keys = self._by_trigram.get(trigram)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        self._by_trigram.pop(trigram, None)
+
+    def _mark_synced(self, inserted, updated, deleted, unchanged=False):
+        self._loaded_at = time.monotonic()
+        self.last_sync = {
+            "inserted": inserted,
+            "updated": updated,
+            "deleted": deleted,
+            "unchanged": unchanged,
         }
-        products.append(product)
-    return products
+        if not unchanged:
+            print(f"🔄 Каталог обновлён: +{inserted} ~{updated} -{deleted}")
+        return self.last_sync
+
+    def is_stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl
+
+    def ensure_loaded(self):
+        if self._loaded_at is None:
+            self.refresh()
+        elif self.is_stale():
+            self._refresh_in_background()
+
+    async def ensure_loaded_async(self):
+        """То же, что ensure_loaded, но не блокирует event loop."""
+        if self._loaded_at is None:
+            await self._shared_refresh()
+        elif self.is_stale():
+            self._refresh_in_background()
+
+    async def _shared_refresh(self):
+        # Все одновременные вызовы ждут одну и ту же загрузку из таблицы
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.ensure_future(asyncio.to_thread(self.refresh))
+        await asyncio.shield(self._inflight)
+
+    def _refresh_in_background(self):
+        with self._refresh_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            # Оставляем старый кэш, попробуем при следующем обращении
+            print("❌ Ошибка обновления каталога:", e)
+        finally:
+            with self._refresh_lock:
+                self._refreshing = False
+
+    def all(self):
+        self.ensure_loaded()
+        return [p.as_dict() for p in list(self._rows.values())]
+
+    def get_by_code(self, code):
+        self.ensure_loaded()
+        # Несколько строк с одним кодом (партии) — первая по порядку листа
+        found = self._by_code.get(str(code).strip())
+        return found[0].as_dict() if found else None
+
+    def find_by_extra_code(self, extra_code):
+        self.ensure_loaded()
+        return [p.as_dict() for p in self._by_extra_code.get(str(extra_code).strip(), [])]
+
+    def find_by_code_ending(self, code_ending):
+        self.ensure_loaded()
+        if len(code_ending) == SUFFIX_LEN:
+            found = self._by_suffix.get(code_ending, [])
+        else:
+            found = [p for p in list(self._rows.values()) if p.code.endswith(code_ending)]
+        # Отдаём словари-копии: обработчики дописывают в них qty/суммы и кладут в FSM
+        return [p.as_dict() for p in found]
+
+    async def find_by_suffix(self, code_ending):
+        """Асинхронный поиск для aiogram-обработчиков."""
+        await self.ensure_loaded_async()
+        return self.find_by_code_ending(code_ending)
+
+    def find_by_name(self, query, limit=SEARCH_LIMIT):
+        """
+        Поиск по части названия, "Товар" или кода: "oolong", "milk oolo", "2933552".
+        Сначала товары, где есть все триграммы запроса; если таких нет (опечатка) —
+        где совпало не меньше половины. Результат отсортирован по релевантности.
+        """
+        self.ensure_loaded()
+        query = normalize_search_text(query)
+        words = query.split()
+        if not words:
+            return []
+        trigrams = set()
+        for word in words:
+            trigrams |= _query_trigrams(word)
+
+        postings = [self._by_trigram.get(t) for t in trigrams]
+        found = [p for p in postings if p]
+        keys = ()
+        if len(found) == len(postings):
+            found.sort(key=len)
+            keys = None
+            if len(found[0]) > SEARCH_BROAD:
+                # Частые триграммы ("tea"): совпадения быстрее найти, просматривая
+                # короткие названия по порядку, чем пересекать большие множества
+                keys = []
+                rarest, rest = found[0], found[1:]
+                for scanned, key in enumerate(self._by_length):
+                    if key in rarest and all(key in posting for posting in rest):
+                        keys.append(key)
+                        if len(keys) >= limit * 5:
+                            break
+                    if scanned >= SEARCH_SCAN_BUDGET:
+                        keys = None
+                        break
+            if keys is None:
+                keys = found[0].intersection(*found[1:])
+                if len(keys) > SEARCH_BROAD:
+                    keys = heapq.nsmallest(limit * 5, keys, key=lambda c: self._length_rank.get(c, 0))
+        if keys:
+            texts = self._search_text
+            best = heapq.nsmallest(limit, keys, key=lambda c: _search_key(texts.get(c, ""), query, words))
+        else:
+            hits = {}
+            for posting in found:
+                for key in list(posting):
+                    hits[key] = hits.get(key, 0) + 1
+            need = max(1, (len(trigrams) + 1) // 2)
+            best = heapq.nsmallest(
+                limit,
+                (key for key, count in hits.items() if count >= need),
+                key=lambda c: (-hits[c], len(self._search_text.get(c, ""))),
+            )
+        products = [self._rows.get(key) for key in best]
+        return [p.as_dict() for p in products if p]
+
+    async def search_by_name(self, query, limit=SEARCH_LIMIT):
+        """Асинхронный поиск по названию для aiogram-обработчиков."""
+        await self.ensure_loaded_async()
+        return self.find_by_name(query, limit)
+
+
+catalog = ProductCatalog(get_worksheet)
+
+
+def get_products():
+    return catalog.all()
+
 
 def find_product_by_code_ending(code_ending):
-    products = get_products()
-    matches = []
-    for product in products:
-        if product["code"].endswith(code_ending):
-            matches.append(product)
-    return matches  # возвращаем список всех совпадений
+    return catalog.find_by_code_ending(code_ending)  # возвращаем список всех совпадений
+
 
+def find_products_by_name(query, limit=SEARCH_LIMIT):
+    return catalog.find_by_name(query, limit)
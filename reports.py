@@ -0,0 +1,266 @@
+# reports.py
+import json
+import os
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+# Дневные итоги продаж: пересчитываются из архива только если он менялся без бота
+REPORTS_FILE = os.getenv("REPORTS_FILE", "sales_rollups.json")
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if x}
+
+GROUPS = ("clients", "managers", "products")
+# Заказы, записанные в архив за столько секунд до начала пересчёта и позже,
+# сверяются с заказами, которые пришли в add() во время и сразу после пересчёта
+REBUILD_OVERLAP = timedelta(minutes=1)
+
+
+def _as_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _add_row(group, key, orders, qty, sum_no_vat, sum_with_vat, name=None):
+    # [заказов, штук, сумма без НДС, сумма с НДС(, название)]
+    row = group.get(key)
+    if row is None:
+        row = group[key] = [0, 0, 0.0, 0.0] + ([name] if name is not None else [])
+    row[0] += orders
+    row[1] += qty
+    row[2] += sum_no_vat
+    row[3] += sum_with_vat
+
+
+def _order_key(order):
+    return json.dumps(order, ensure_ascii=False, sort_keys=True)
+
+
+def _fold(days, months, order):
+    day = str(order.get("timestamp", ""))[:10]
+    if not day:
+        return
+    buckets = [
+        days.setdefault(day, {group: {} for group in GROUPS}),
+        months.setdefault(day[:7], {group: {} for group in GROUPS}),
+    ]
+    qty_total = sum_no_vat_total = sum_with_vat_total = 0
+    codes = set()
+    for p in order.get("products", []):
+        qty = _as_int(p.get("qty"))
+        sum_no_vat = _as_float(p.get("sum_no_vat"))
+        sum_with_vat = _as_float(p.get("sum_with_vat"))
+        code = str(p.get("code", ""))
+        for totals in buckets:
+            _add_row(totals["products"], code, 0 if code in codes else 1, qty, sum_no_vat, sum_with_vat,
+                     name=p.get("name", ""))
+        codes.add(code)
+        qty_total += qty
+        sum_no_vat_total += sum_no_vat
+        sum_with_vat_total += sum_with_vat
+    for totals in buckets:
+        for group, key in (("clients", order.get("client")), ("managers", order.get("manager"))):
+            _add_row(totals[group], key or "—", 1, qty_total, sum_no_vat_total, sum_with_vat_total)
+
+
+class SalesReports:
+    """
+    Итоги по клиентам, менеджерам и кодам товаров за каждый день и месяц.
+    Архив читается потоково один раз (или если менялся в обход бота),
+    дальше каждый заказ добавляется в итоги своего дня и месяца при записи в архив.
+    Отчёт за период складывает месячные итоги целых месяцев и дневные
+    итоги по краям периода и не трогает архив.
+    iter_archive — генератор заказов архива, archive_marker — строка,
+    которая меняется при любой записи в архив (размер файла, число строк в базе).
+    """
+
+    def __init__(self, path, iter_archive, archive_marker):
+        self.path = path
+        self._iter_archive = iter_archive
+        self._archive_marker = archive_marker
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._pending = None
+        self._recent = None
+        self._recent_until = None
+        self._days = None
+        self._months = None
+        self._marker = None
+        self._dirty = False
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            return saved["marker"], saved["days"], saved["months"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return None, None, None
+
+    def ensure_built(self):
+        """
+        Загружает итоги с диска или пересчитывает их потоковым проходом по архиву.
+        Итоги собираются в локальные словари и подменяются только после полного прохода:
+        если чтение архива упало, итоги остаются незагруженными и пересчитаются при следующем вызове.
+        """
+        with self._build_lock:
+            with self._lock:
+                if self._days is not None:
+                    return
+                marker = self._archive_marker()
+                saved_marker, days, months = self._load()
+                if days is not None and saved_marker == marker:
+                    self._days, self._months, self._marker = days, months, marker
+                    return
+                # Заказы, которые допишутся в архив во время прохода, add() складывает сюда
+                self._pending = []
+            days, months = {}, {}
+            recent = Counter()
+            since = (datetime.now() - REBUILD_OVERLAP).isoformat()
+            count = 0
+            try:
+                for order in self._iter_archive():
+                    _fold(days, months, order)
+                    if str(order.get("timestamp", "")) >= since:
+                        recent[_order_key(order)] += 1
+                    count += 1
+            except Exception:
+                with self._lock:
+                    self._pending = None
+                raise
+            with self._lock:
+                # Заказ мог попасть и в проход по архиву, и в add(): считаем его один раз
+                for order in self._pending:
+                    if not self._seen_in_rebuild(recent, order):
+                        _fold(days, months, order)
+                self._pending = None
+                self._recent = recent
+                self._recent_until = datetime.now() + REBUILD_OVERLAP
+                self._days, self._months = days, months
+                self._marker = self._archive_marker()
+                self._dirty = True
+            print(f"📊 Итоги продаж пересчитаны по архиву: {count} заказов")
+        self.save()
+
+    @staticmethod
+    def _seen_in_rebuild(recent, order):
+        key = _order_key(order)
+        if recent[key] > 0:
+            recent[key] -= 1
+            return True
+        return False
+
+    def add(self, order):
+        """Добавляет только что заархивированный заказ (с timestamp) в итоги его дня."""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(order)  # идёт пересчёт — учтём в его конце
+                return
+            if self._days is None:
+                return  # итоги ещё не загружались — заказ попадёт в них при загрузке
+            if self._recent is not None and datetime.now() > self._recent_until:
+                self._recent = None
+            if self._recent is not None and self._seen_in_rebuild(self._recent, order):
+                return  # записан в архив во время пересчёта и уже в нём учтён
+            _fold(self._days, self._months, order)
+            self._marker = self._archive_marker()
+            self._dirty = True
+
+    def save(self):
+        """Пишет итоги на диск (атомарно). Зовётся после пересчёта и при остановке бота."""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps({"marker": self._marker, "days": self._days, "months": self._months},
+                              ensure_ascii=False)
+            self._dirty = False
+        tmp_file = self.path + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_file, self.path)
+
+    def _buckets(self, date_from, date_to):
+        # Целые месяцы берём из месячных итогов, неполные — по дням
+        cursor = date_from
+        while cursor <= date_to:
+            month_end = (cursor.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+            if cursor.day == 1 and month_end <= date_to:
+                totals = self._months.get(cursor.isoformat()[:7])
+                if totals:
+                    yield totals
+            else:
+                day = cursor
+                while day <= min(month_end, date_to):
+                    totals = self._days.get(day.isoformat())
+                    if totals:
+                        yield totals
+                    day += timedelta(days=1)
+            cursor = month_end + timedelta(days=1)
+
+    def report(self, date_from: date, date_to: date):
+        """Итоги за период [date_from, date_to]: {"orders", "qty", "sum_no_vat", "sum_with_vat", группы...}."""
+        self.ensure_built()
+        result = {group: {} for group in GROUPS}
+        with self._lock:
+            for totals in self._buckets(date_from, date_to):
+                for group in GROUPS:
+                    for key, row in totals[group].items():
+                        _add_row(result[group], key, *row[:4], name=row[4] if len(row) > 4 else None)
+        clients = result["clients"].values()
+        result["orders"] = sum(row[0] for row in clients)
+        result["qty"] = sum(row[1] for row in clients)
+        result["sum_no_vat"] = sum(row[2] for row in clients)
+        result["sum_with_vat"] = sum(row[3] for row in clients)
+        return result
+
+
+def parse_period(args, today=None):
+    """
+    Период для /report: без аргументов — текущий месяц, "2025-08" — месяц,
+    "2025-08-01 2025-08-31" или "01.08.2025 31.08.2025" — диапазон, одна дата — один день.
+    """
+    today = today or date.today()
+    if not args:
+        return today.replace(day=1), today
+    if len(args) == 1 and len(args[0]) == 7 and args[0][4] == "-":
+        start = datetime.strptime(args[0], "%Y-%m").date()
+        next_month = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        return start, next_month - timedelta(days=1)
+
+    def parse(text):
+        for fmt in ("%Y-%m-%d", "%d.%m.%Y"):
+            try:
+                return datetime.strptime(text, fmt).date()
+            except ValueError:
+                pass
+        raise ValueError(text)
+
+    start = parse(args[0])
+    end = parse(args[1]) if len(args) > 1 else start
+    return start, end
+
+
+def format_report(report, date_from, date_to, top=10):
+    lines = [
+        f"📊 Продажи {date_from:%d.%m.%Y} — {date_to:%d.%m.%Y}",
+        f"Заказов: {report['orders']}, штук: {report['qty']}",
+        f"Сумма без НДС: {report['sum_no_vat']:.2f} €, с НДС: {report['sum_with_vat']:.2f} €",
+    ]
+    titles = (("clients", "💎 Клиенты"), ("managers", "👤 Менеджеры"), ("products", "📦 Товары"))
+    for group, title in titles:
+        rows = sorted(report[group].items(), key=lambda item: item[1][3], reverse=True)
+        if not rows:
+            continue
+        lines.append("")
+        lines.append(f"{title} (топ {min(top, len(rows))} из {len(rows)}):")
+        for key, row in rows[:top]:
+            label = f"{key} {row[4][:30]}" if group == "products" and len(row) > 4 else key
+            lines.append(f"• {label}: {row[0]} зак., {row[1]} шт, {row[3]:.2f} €")
+    return "\n".join(lines)
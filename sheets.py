@@ -1,8 +1,11 @@
 import os
+import threading
+import time
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from dotenv import load_dotenv
 from datetime import datetime
+from metrics import timer
 
 # Загружаем .env
 load_dotenv()
@@ -12,16 +15,108 @@ GOOGLE_KEY_FILE = os.getenv("GOOGLE_KEY_FILE")
 SPREADSHEET_ID = os.getenv("SPREADSHEET_ID")
 TEMP_ORDERS_SHEET = os.getenv("TEMP_ORDERS_SHEET", "TempOrders")
 
-# Авторизация в Google Sheets API
+# Авторизация в Google Sheets API — при первом обращении к таблице
 scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-creds = ServiceAccountCredentials.from_json_keyfile_name(GOOGLE_KEY_FILE, scope)
-client = gspread.authorize(creds)
+_client = None
+
+# Индекс строк TempOrders: user_id -> [(первая строка, последняя строка), ...].
+# Обновляется при наших записях, целиком перестраивается по колонке UserID,
+# если лист поменяли вручную или индекс старше TEMP_ORDERS_INDEX_TTL секунд.
+TEMP_ORDERS_INDEX_TTL = float(os.getenv("TEMP_ORDERS_INDEX_TTL", "600"))
+_row_index = None
+_row_index_built_at = 0.0
+_sheet_lock = threading.Lock()
+_temp_orders_ws = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        creds = ServiceAccountCredentials.from_json_keyfile_name(GOOGLE_KEY_FILE, scope)
+        _client = gspread.authorize(creds)
+    return _client
 
 
 def get_temp_orders_worksheet():
-    """Открываем лист TempOrders"""
-    spreadsheet = client.open_by_key(SPREADSHEET_ID)
-    return spreadsheet.worksheet(TEMP_ORDERS_SHEET)
+    """Открываем лист TempOrders (один раз за время работы бота)"""
+    global _temp_orders_ws
+    if _temp_orders_ws is None:
+        spreadsheet = get_client().open_by_key(SPREADSHEET_ID)
+        _temp_orders_ws = spreadsheet.worksheet(TEMP_ORDERS_SHEET)
+    return _temp_orders_ws
+
+
+def _row_ranges(row_numbers):
+    """Номера строк -> [(первая, последняя), ...] подряд идущих строк."""
+    ranges = []
+    for row_number in sorted(row_numbers):
+        if ranges and ranges[-1][1] == row_number - 1:
+            ranges[-1] = (ranges[-1][0], row_number)
+        else:
+            ranges.append((row_number, row_number))
+    return ranges
+
+
+def _build_row_index(user_column):
+    """Строит индекс по значениям колонки UserID (первая строка — шапка)."""
+    rows_by_user = {}
+    for row_number, user_id in enumerate(user_column, start=1):
+        if row_number > 1 and user_id:
+            rows_by_user.setdefault(str(user_id), []).append(row_number)
+    return {user_id: _row_ranges(rows) for user_id, rows in rows_by_user.items()}
+
+
+def _set_row_index(index):
+    global _row_index, _row_index_built_at
+    _row_index = index
+    _row_index_built_at = time.monotonic()
+
+
+def _get_row_index(ws, rebuild=False):
+    if rebuild or _row_index is None or time.monotonic() - _row_index_built_at > TEMP_ORDERS_INDEX_TTL:
+        _set_row_index(_build_row_index(ws.col_values(2)))
+    return _row_index
+
+
+def _shift_row_index(start, end):
+    """Сдвигает индекс после удаления строк start..end."""
+    removed = end - start + 1
+    for user_id, ranges in _row_index.items():
+        _row_index[user_id] = [
+            (s - removed, e - removed) if s > end else (s, e)
+            for s, e in ranges
+        ]
+
+
+def _read_user_rows(ws, user_id):
+    """
+    Читает только строки пользователя по индексу.
+    Если строки не совпали с индексом (лист правили вручную) — перестраивает его.
+    Возвращает (диапазоны строк, строки); в диапазоны попадают только строки,
+    в которых UserID действительно совпал.
+    """
+    user_id = str(user_id)
+    for rebuild in (False, True):
+        ranges = _get_row_index(ws, rebuild=rebuild).get(user_id, [])
+        if not ranges:
+            return [], []
+        blocks = ws.batch_get([f"A{start}:H{end}" for start, end in ranges])
+        numbered = [
+            (start + offset, list(row) + [""] * (8 - len(row)))
+            for (start, _), block in zip(ranges, blocks)
+            for offset, row in enumerate(block)
+        ]
+        expected = sum(end - start + 1 for start, end in ranges)
+        if len(numbered) == expected and all(row[1] == user_id for _, row in numbered):
+            return ranges, [row for _, row in numbered]
+        if not rebuild:
+            print("⚠️ TempOrders изменён вне бота — перестраиваю индекс строк")
+    # Лист меняется прямо сейчас: берём только проверенные строки, чужие не трогаем
+    own = [(row_number, row) for row_number, row in numbered if row[1] == user_id]
+    return _row_ranges(row_number for row_number, _ in own), [row for _, row in own]
+
+
+TEMP_ORDERS_HEADER = ["Дата", "UserID", "Клиент", "Код товара", "Наименование", "Кол-во", "Цена", "Комментарий"]
 
 
 def save_user_order_state(user_id, order_data):
@@ -29,29 +124,26 @@ def save_user_order_state(user_id, order_data):
     Сохраняем заказ в красивом виде в TempOrders:
     Дата | UserID | Клиент | Код товара | Наименование | Кол-во | Цена | Комментарий
     """
-    ws = get_temp_orders_worksheet()
+    save_user_order_states({user_id: order_data})
 
-    # Заголовки
-    header = ["Дата", "UserID", "Клиент", "Код товара", "Наименование", "Кол-во", "Цена", "Комментарий"]
-    all_data = ws.get_all_values()
 
-    # Если шапка пустая — создаём её
-    if not all_data or all_data[0] != header:
-        if all_data:
-            ws.insert_row(header, 1)
-        else:
-            ws.append_row(header)
+def save_user_order_states(states):
+    """
+    Сохраняет черновики сразу нескольких пользователей: {user_id: order_data}.
+    order_data=None удаляет строки пользователя.
+    Лист читается один раз, а записываются одним batch_update только строки
+    этих пользователей — строки остальных менеджеров не переписываются.
+    """
+    with _sheet_lock, timer("dependency_seconds", dependency="sheets", op="temp_orders_save"):
+        _save_user_order_states(get_temp_orders_worksheet(), states)
 
-    # Удаляем старые строки этого пользователя (начиная со 2-й)
-    all_data = ws.get_all_values()
-    rows_to_delete = [idx for idx, row in enumerate(all_data, start=1) if idx > 1 and row and row[1] == str(user_id)]
-    for idx in reversed(rows_to_delete):
-        ws.delete_rows(idx)
-
-    # Записываем новые строки
-    for product in order_data.get("products", []):
-        ws.append_row([
-            datetime.now().strftime("%Y-%m-%d %H:%M"),
+
+def _order_rows(user_id, order_data, now):
+    if not order_data:
+        return []
+    return [
+        [
+            now,
             str(user_id),
             order_data.get("client", ""),
             product.get("code", ""),
@@ -59,20 +151,73 @@ def save_user_order_state(user_id, order_data):
             product.get("qty", ""),
             product.get("price", ""),
             order_data.get("note", "")
+        ]
+        for product in order_data.get("products", [])
+    ]
+
+
+def _save_user_order_states(ws, states):
+    all_data = ws.get_all_values()
+    user_ids = {str(user_id) for user_id in states}
+    now = datetime.now().strftime("%Y-%m-%d %H:%M")
+    fresh = [row for user_id, order_data in states.items() for row in _order_rows(user_id, order_data, now)]
+    width = len(TEMP_ORDERS_HEADER)
+
+    if all_data and all_data[0] != TEMP_ORDERS_HEADER and any(all_data[0]):
+        # Лист без шапки: один раз переписываем целиком, чтобы шапка встала сверху
+        rows = [row for row in all_data if not (len(row) > 1 and row[1] in user_ids)] + fresh
+        values = [TEMP_ORDERS_HEADER] + rows
+        values += [[] for _ in range(len(all_data) - len(values))]
+        values = [list(row) + [""] * (width - len(row)) for row in values]
+        ws.update(values=values, range_name="A1")
+        _set_row_index(_build_row_index([row[1] for row in values]))
+        return
+
+    # Новые строки занимают места старых строк этих пользователей и пустые строки,
+    # остаток дописывается в конец листа; лишние старые строки очищаются
+    grid = [list(row) + [""] * (width - len(row)) for row in all_data] or [[""] * width]
+    changed = {}
+    if grid[0] != TEMP_ORDERS_HEADER:
+        grid[0] = list(TEMP_ORDERS_HEADER)
+        changed[1] = grid[0]
+    free = [
+        row_number for row_number, row in enumerate(grid[1:], start=2)
+        if row[1] in user_ids or not any(row)
+    ]
+    for i, row in enumerate(fresh):
+        if i < len(free):
+            row_number = free[i]
+            grid[row_number - 1] = row
+        else:
+            grid.append(row)
+            row_number = len(grid)
+        changed[row_number] = row
+    for row_number in free[len(fresh):]:
+        if any(grid[row_number - 1]):
+            grid[row_number - 1] = [""] * width
+            changed[row_number] = grid[row_number - 1]
+
+    if changed:
+        ws.batch_update([
+            {"range": f"A{start}:H{end}", "values": [changed[n] for n in range(start, end + 1)]}
+            for start, end in _row_ranges(changed)
         ])
+    # Раскладка листа известна целиком — индекс строк берём из записанного
+    _set_row_index(_build_row_index([row[1] for row in grid]))
 
 
 def load_user_order_state(user_id):
     """Читаем заказ из TempOrders и собираем в структуру Python"""
     ws = get_temp_orders_worksheet()
-    all_data = ws.get_all_values()
+    with _sheet_lock, timer("dependency_seconds", dependency="sheets", op="temp_orders_load"):
+        _, rows = _read_user_rows(ws, user_id)
 
     products = []
     client = None
     note = None
 
-    for row in all_data[1:]:  # пропускаем шапку
-        if row and row[1] == str(user_id):
+    for row in rows:
+        if row[1] == str(user_id):
             products.append({
                 "code": row[3],
                 "name": row[4],
@@ -95,8 +240,9 @@ def load_user_order_state(user_id):
 def delete_user_order_state(user_id):
     """Удаляем все строки пользователя из TempOrders"""
     ws = get_temp_orders_worksheet()
-    all_data = ws.get_all_values()
-
-    rows_to_delete = [idx for idx, row in enumerate(all_data, start=1) if idx > 1 and row and row[1] == str(user_id)]
-    for idx in reversed(rows_to_delete):
-        ws.delete_rows(idx)
+    with _sheet_lock, timer("dependency_seconds", dependency="sheets", op="temp_orders_delete"):
+        ranges, _ = _read_user_rows(ws, user_id)
+        for start, end in reversed(ranges):
+            ws.delete_rows(start, end)
+            _shift_row_index(start, end)
+        _row_index.pop(str(user_id), None)
@@ -0,0 +1,83 @@
+# sheets_sync.py
+import asyncio
+import copy
+import os
+
+from metrics import gauge, timer
+from sheets import save_user_order_states
+
+# Копия черновиков в TempOrders выключена по умолчанию: включается TEMP_ORDERS_SYNC=1
+TEMP_ORDERS_SYNC_ENABLED = os.getenv("TEMP_ORDERS_SYNC", "0") == "1"
+TEMP_ORDERS_SYNC_INTERVAL = float(os.getenv("TEMP_ORDERS_SYNC_INTERVAL", "5"))
+
+
+class TempOrdersSync:
+    """
+    Фоновая отложенная запись черновиков в лист TempOrders.
+    Для каждого user_id хранится только последняя версия заказа;
+    раз в interval секунд все изменённые черновики уходят в таблицу
+    одной пачкой, при остановке — всё, что осталось.
+    """
+
+    def __init__(self, interval=TEMP_ORDERS_SYNC_INTERVAL, writer=save_user_order_states,
+                 enabled=TEMP_ORDERS_SYNC_ENABLED):
+        self.interval = interval
+        self.enabled = enabled
+        self._writer = writer
+        self._pending = {}
+        self._task = None
+        self._stopping = asyncio.Event()
+
+    def schedule(self, user_id, order_data):
+        """Запоминает актуальный черновик; предыдущий несохранённый вариант заменяется."""
+        if not self.enabled:
+            return
+        # Копия: обработчики продолжают менять заказ, пока идёт запись
+        self._pending[str(user_id)] = copy.deepcopy(order_data)
+
+    def schedule_delete(self, user_id):
+        if not self.enabled:
+            return
+        self._pending[str(user_id)] = None
+
+    @property
+    def queue_depth(self):
+        return len(self._pending)
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        try:
+            with timer("temp_orders_flush_seconds"):
+                await asyncio.to_thread(self._writer, batch)
+        except Exception as e:
+            print("❌ Ошибка синхронизации TempOrders:", e)
+            # Возвращаем в очередь то, что не успели заменить более новой версией
+            for user_id, order_data in batch.items():
+                self._pending.setdefault(user_id, order_data)
+
+    async def stop(self):
+        """Останавливает фоновую задачу и дописывает все черновики."""
+        self._stopping.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+
+
+temp_orders_sync = TempOrdersSync()
+# Сколько черновиков ждут записи в TempOrders — для /metrics
+gauge("temp_orders_queue_depth", lambda: temp_orders_sync.queue_depth)
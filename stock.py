@@ -0,0 +1,158 @@
+# stock.py
+import os
+import threading
+import time
+
+from products import catalog
+
+# Сколько секунд держится резерв незавершённого заказа (с последнего изменения количества)
+RESERVATION_TTL = float(os.getenv("RESERVATION_TTL", "3600"))
+
+
+def parse_stock(value):
+    """Остаток из таблицы числом; пустая или нечисловая ячейка — None (остаток неизвестен)."""
+    try:
+        return int(float(str(value).replace(",", ".").replace(" ", "")))
+    except (TypeError, ValueError):
+        return None
+
+
+def order_quantities(products):
+    """{код: штук} по строкам заказа (один товар может встречаться в заказе дважды)."""
+    totals = {}
+    for p in products:
+        code = str(p.get("code", ""))
+        totals[code] = totals.get(code, 0) + int(p.get("qty") or 0)
+    return totals
+
+
+class StockLedger:
+    """
+    Учёт остатков в памяти поверх каталога склада.
+    Доступно = остаток в таблице - продано после последней сверки - резервы других менеджеров.
+    Резерв ставится при вводе количества, по подтверждению заказа переходит в продажи,
+    при отмене или через ttl секунд без изменений снимается.
+    При каждом обновлении каталога продажи сверяются с таблицей: если остаток
+    в ней уменьшился, считаем, что бухгалтер уже списал столько же наших продаж.
+    Все изменения — под одной блокировкой: обработчики и фоновое обновление
+    каталога работают из разных потоков.
+    """
+
+    def __init__(self, ttl=RESERVATION_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._sheet = {}     # код -> остаток по таблице
+        self._sold = {}      # код -> продано, но ещё не списано в таблице
+        self._reserved = {}  # код -> штук в резервах всех менеджеров
+        self._holds = {}     # user_id -> ({код: штук}, когда истекает)
+
+    def _drop_hold(self, user_id):
+        quantities, _ = self._holds.pop(str(user_id), ({}, None))
+        for code, qty in quantities.items():
+            left = self._reserved.get(code, 0) - qty
+            if left > 0:
+                self._reserved[code] = left
+            else:
+                self._reserved.pop(code, None)
+        return quantities
+
+    def _expire(self):
+        now = time.monotonic()
+        for user_id in [u for u, (_, expires) in self._holds.items() if expires <= now]:
+            self._drop_hold(user_id)
+
+    def _available(self, code, stock, own=0):
+        if code in self._sheet:
+            stock = self._sheet[code]
+        else:
+            stock = parse_stock(stock)
+        if stock is None:
+            return None
+        return stock - self._sold.get(code, 0) - (self._reserved.get(code, 0) - own)
+
+    def available(self, code, stock=None, user_id=None):
+        """
+        Сколько штук ещё можно продать; None — остаток в таблице неизвестен.
+        stock — остаток из карточки товара, если код ещё не попадал в сверку.
+        Резерв самого user_id не вычитается.
+        """
+        with self._lock:
+            self._expire()
+            own = self._holds.get(str(user_id), ({}, None))[0].get(code, 0)
+            return self._available(code, stock, own)
+
+    def hold(self, user_id, products):
+        """
+        Заменяет резерв пользователя количествами из строк заказа products.
+        Если какого-то товара не хватает, резерв не меняется и возвращается
+        (код, доступно штук); иначе None.
+        """
+        quantities = order_quantities(products)
+        stocks = {str(p.get("code", "")): p.get("stock") for p in products}
+        with self._lock:
+            self._expire()
+            current = self._holds.get(str(user_id), ({}, None))[0]
+            for code, qty in quantities.items():
+                if qty <= current.get(code, 0):
+                    continue  # уменьшение или то же количество проходит всегда
+                available = self._available(code, stocks.get(code), current.get(code, 0))
+                if available is not None and qty > available:
+                    return code, max(available, 0)
+            self._drop_hold(user_id)
+            quantities = {code: qty for code, qty in quantities.items() if qty > 0}
+            if quantities:
+                self._holds[str(user_id)] = (quantities, time.monotonic() + self.ttl)
+                for code, qty in quantities.items():
+                    self._reserved[code] = self._reserved.get(code, 0) + qty
+        return None
+
+    def commit(self, user_id, products):
+        """Заказ подтверждён: резерв пользователя снимается, строки заказа записываются в продажи."""
+        with self._lock:
+            self._drop_hold(user_id)
+            for code, qty in order_quantities(products).items():
+                if qty > 0:
+                    self._sold[code] = self._sold.get(code, 0) + qty
+
+    def release(self, user_id):
+        """Заказ отменён или начат заново: резерв пользователя снимается."""
+        with self._lock:
+            self._drop_hold(user_id)
+
+    def reconcile(self, stocks):
+        """
+        Сверка с таблицей после обновления каталога: stocks — {код: [остатки строк]} всего листа.
+        Партии одного кода (несколько строк) складываются.
+        """
+        with self._lock:
+            for code, values in stocks.items():
+                known = [stock for stock in map(parse_stock, values) if stock is not None]
+                stock = sum(known) if known else None
+                previous = self._sheet.get(code)
+                sold = self._sold.get(code, 0)
+                if sold and stock is not None and previous is not None and stock < previous:
+                    left = sold - min(sold, previous - stock)
+                    if left:
+                        self._sold[code] = left
+                    else:
+                        self._sold.pop(code, None)
+                if stock is None:
+                    self._sheet.pop(code, None)
+                else:
+                    self._sheet[code] = stock
+            for code in [c for c in self._sheet if c not in stocks]:
+                self._sheet.pop(code, None)
+                self._sold.pop(code, None)
+
+    def stats(self):
+        with self._lock:
+            self._expire()
+            return {
+                "holds": len(self._holds),
+                "reserved": sum(self._reserved.values()),
+                "sold_unsynced": sum(self._sold.values()),
+            }
+
+
+stock_ledger = StockLedger()
+catalog.on_sync(stock_ledger.reconcile)
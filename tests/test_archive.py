@@ -0,0 +1,57 @@
+"""Архив заказов: прерванный перенос старого архива не оставляет полуготовый архив."""
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from archive import OrderArchive
+
+
+def legacy_orders(count, fail_after=None):
+    for i in range(count):
+        if fail_after is not None and i == fail_after:
+            raise OSError("процесс остановлен посреди переноса")
+        yield {"timestamp": f"2025-{1 + i % 12:02d}-10T12:00:00", "client": f"C{i}", "manager": "M", "n": i}
+
+
+class ImportOrdersTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmp.name, "orders_archive")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_interrupted_import_is_redone_from_scratch(self):
+        archive = OrderArchive(self.directory)
+        with self.assertRaises(OSError):
+            archive.import_orders(legacy_orders(5000, fail_after=2500))
+        # Часть пачек уже записана, но архива ещё нет: перенос повторится целиком
+        self.assertFalse(archive.exists())
+        self.assertFalse(os.path.exists(self.directory))
+
+        restarted = OrderArchive(self.directory)
+        self.assertEqual(restarted.import_orders(legacy_orders(5000)), 5000)
+        self.assertTrue(restarted.exists())
+        self.assertFalse(os.path.exists(self.directory + ".importing"))
+        numbers = sorted(order["n"] for order in OrderArchive(self.directory).iter_orders())
+        self.assertEqual(numbers, list(range(5000)))
+        self.assertEqual(len(OrderArchive(self.directory).find(client="C4999")), 1)
+
+    def test_import_into_existing_archive_appends(self):
+        archive = OrderArchive(self.directory)
+        archive.append({"timestamp": "2025-01-01T10:00:00", "client": "A", "manager": "M", "n": -1})
+        self.assertEqual(archive.import_orders(legacy_orders(10)), 10)
+        self.assertEqual(sum(1 for _ in OrderArchive(self.directory).iter_orders()), 11)
+
+    def test_empty_import_creates_archive(self):
+        archive = OrderArchive(self.directory)
+        self.assertEqual(archive.import_orders([]), 0)
+        self.assertTrue(archive.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
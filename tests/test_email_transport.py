@@ -0,0 +1,91 @@
+"""SMTPPool против локального SMTP-сервера: переподключение и повтор только до DATA."""
+import asyncio
+import os
+import sys
+import unittest
+from email.message import EmailMessage
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import aiosmtplib
+
+from email_transport import SMTPPool
+from fakes import FakeSMTPServer
+
+
+def make_message(n):
+    msg = EmailMessage()
+    msg["From"] = "bot@example.com"
+    msg["To"] = "accountant@example.com"
+    msg["Subject"] = f"Заказ {n}"
+    msg.set_content(f"order {n}")
+    return msg
+
+
+async def with_pool(server, send):
+    await server.start()
+    pool = SMTPPool("bot@example.com", "secret", hostname="127.0.0.1", port=server.port,
+                    use_tls=False, size=1)
+    try:
+        return await send(pool), pool
+    finally:
+        await pool.close()
+        await server.stop()
+
+
+class SMTPPoolTest(unittest.TestCase):
+    def test_messages_share_one_connection(self):
+        server = FakeSMTPServer()
+
+        async def send(pool):
+            for n in range(3):
+                await pool.send(make_message(n))
+
+        _, pool = asyncio.run(with_pool(server, send))
+        self.assertEqual(len(server.messages), 3)
+        self.assertEqual(pool.sent, 3)
+        self.assertEqual(pool.connects, 1)
+
+    def test_disconnect_before_data_is_retried(self):
+        # Сервер рвёт соединение после первого письма: второе уходит по новому
+        server = FakeSMTPServer(drop_after=1)
+
+        async def send(pool):
+            await pool.send(make_message(1))
+            await asyncio.sleep(0.05)
+            await pool.send(make_message(2))
+
+        _, pool = asyncio.run(with_pool(server, send))
+        self.assertEqual(len(server.messages), 2)
+        self.assertIn(b"order 2", server.messages[1])
+        self.assertEqual(pool.connects, 2)
+
+    def test_disconnect_after_data_is_not_retried(self):
+        # Текст письма сервер получил, но ответа на DATA нет: повтор дал бы дубль
+        server = FakeSMTPServer(drop_in_data=True)
+
+        async def send(pool):
+            # assertRaises здесь не годится: он очищает кадры traceback, среди которых кадры воркера пула
+            try:
+                await pool.send(make_message(1))
+            except aiosmtplib.SMTPServerDisconnected as e:
+                error = e
+            else:
+                error = None
+            server.drop_in_data = False
+            await pool.send(make_message(2))
+            return error
+
+        error, pool = asyncio.run(with_pool(server, send))
+        self.assertIsInstance(error, aiosmtplib.SMTPServerDisconnected)
+        self.assertEqual(len(server.messages), 2)
+        self.assertIn(b"order 1", server.messages[0])
+        self.assertIn(b"order 2", server.messages[1])
+        self.assertEqual(pool.sent, 1)
+        self.assertEqual(pool.connects, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+"""SQLiteStorage: сессии, которые не удалось записать, не теряются."""
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from aiogram.fsm.storage.base import StorageKey
+
+from fsm_storage import SQLiteStorage
+
+
+class FlushFailureTest(unittest.TestCase):
+    def test_failed_write_is_retried(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "fsm.db")
+
+            async def run():
+                storage = SQLiteStorage(path, flush_interval=0.01)
+                write = storage._write
+                failures = [sqlite3.OperationalError("database is locked")]
+
+                def flaky_write(upserts, deletes):
+                    if failures:
+                        raise failures.pop()
+                    write(upserts, deletes)
+
+                storage._write = flaky_write
+                await storage.set_state(StorageKey(bot_id=1, chat_id=2, user_id=3), "OrderState:client")
+                await storage.flush()  # первая запись падает
+                self.assertEqual(len(storage._dirty), 1)
+                await storage.close()
+
+            asyncio.run(run())
+            with sqlite3.connect(path) as conn:
+                rows = conn.execute("SELECT state FROM fsm").fetchall()
+            self.assertEqual(rows, [("OrderState:client",)])
+
+
+if __name__ == "__main__":
+    unittest.main()
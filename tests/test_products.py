@@ -0,0 +1,171 @@
+"""Каталог склада: одновременные поиски и инкрементальная синхронизация с таблицей."""
+import asyncio
+import os
+import sys
+import threading
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from fakes import FakeWorksheet, STOCK_HEADER
+from products import ProductCatalog
+
+# Задержка одного чтения листа — как сетевой запрос к Google Sheets
+SHEET_DELAY = 0.2
+# Сколько менеджеров ищут одновременно
+CONCURRENT = 20
+
+
+class SlowWorksheet(FakeWorksheet):
+    """Лист, чтение которого блокирует поток на SHEET_DELAY секунд и считается."""
+
+    def __init__(self, values):
+        super().__init__(values)
+        self.reads = 0
+        self._reads_lock = threading.Lock()
+
+    def get_all_records(self):
+        with self._reads_lock:
+            self.reads += 1
+        time.sleep(SHEET_DELAY)
+        return super().get_all_records()
+
+
+def make_worksheet(count=100):
+    return SlowWorksheet([STOCK_HEADER] + [
+        [f"4792252{i:06d}", f"T{i}", f"green tea #{i}", 10, "15.01.2028", "4,25", "5,10"]
+        for i in range(count)
+    ])
+
+
+class FindBySuffixConcurrencyTest(unittest.TestCase):
+    def test_cold_catalog_loads_sheet_once(self):
+        ws = make_worksheet()
+        catalog = ProductCatalog(lambda: ws)
+
+        async def run():
+            start = time.perf_counter()
+            results = await asyncio.gather(*[catalog.find_by_suffix(f"{i:04d}") for i in range(CONCURRENT)])
+            return results, time.perf_counter() - start
+
+        results, elapsed = asyncio.run(run())
+        self.assertEqual(ws.reads, 1)
+        self.assertLess(elapsed, SHEET_DELAY * 3)
+        for i, found in enumerate(results):
+            self.assertEqual([p["code"] for p in found], [f"4792252{i:06d}"])
+
+    def test_cold_load_does_not_block_event_loop(self):
+        ws = make_worksheet()
+        catalog = ProductCatalog(lambda: ws)
+        ticks = []
+
+        async def ticker():
+            while len(ticks) < 5:
+                ticks.append(time.perf_counter())
+                await asyncio.sleep(SHEET_DELAY / 10)
+
+        async def run():
+            await asyncio.gather(ticker(), *[catalog.find_by_suffix("0001") for _ in range(CONCURRENT)])
+
+        start = time.perf_counter()
+        asyncio.run(run())
+        # Пока лист читается в потоке, цикл событий продолжает обслуживать другие задачи
+        self.assertLess(ticks[-1] - start, SHEET_DELAY)
+
+    def test_stale_catalog_answers_from_memory(self):
+        ws = make_worksheet()
+        catalog = ProductCatalog(lambda: ws, ttl=0)
+        catalog.refresh()
+
+        async def run():
+            start = time.perf_counter()
+            results = await asyncio.gather(*[catalog.find_by_suffix("0007") for _ in range(CONCURRENT)])
+            return results, time.perf_counter() - start
+
+        results, elapsed = asyncio.run(run())
+        # Устаревший кэш обновляется в фоне, поиск не ждёт таблицу
+        self.assertLess(elapsed, SHEET_DELAY / 2)
+        self.assertTrue(all(len(found) == 1 for found in results))
+        deadline = time.monotonic() + SHEET_DELAY * 10
+        while catalog._refreshing and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(ws.reads, 2)
+
+
+
+class FakeSpreadsheet:
+    """Таблица с временем последней правки, как у Drive API (products.sheet_revision)."""
+
+    def __init__(self):
+        self.revision = "r1"
+
+    def get_lastUpdateTime(self):
+        return self.revision
+
+
+def stock_row(code, stock, expiry="15.01.2028", name=None):
+    return [code, f"T{code}", name or f"green tea {code}", stock, expiry, "4,25", "5,10"]
+
+
+class IncrementalSyncTest(unittest.TestCase):
+    def setUp(self):
+        self.ws = FakeWorksheet([STOCK_HEADER] + [stock_row(f"4792252{i:06d}", 10) for i in range(5)])
+        self.catalog = ProductCatalog(lambda: self.ws)
+
+    def test_counts_inserted_updated_deleted(self):
+        self.assertEqual(self.catalog.sync()["inserted"], 5)
+        self.ws.values[1][3] = 7                          # изменён остаток
+        del self.ws.values[3]                             # удалена строка
+        self.ws.values.append(stock_row("4792252000099", 1))  # добавлена строка
+        stats = self.catalog.sync()
+        self.assertEqual((stats["inserted"], stats["updated"], stats["deleted"]), (1, 1, 1))
+        self.assertFalse(stats["unchanged"])
+        self.assertEqual(self.catalog.get_by_code("4792252000000")["stock"], 7)
+        self.assertIsNone(self.catalog.get_by_code("4792252000002"))
+        self.assertEqual(len(self.catalog.find_by_code_ending("0099")), 1)
+        self.assertEqual([p["code"] for p in self.catalog.find_by_name("green tea 4792252000099")][:1],
+                         ["4792252000099"])
+
+    def test_same_content_is_unchanged(self):
+        self.catalog.sync()
+        stats = self.catalog.sync()
+        self.assertTrue(stats["unchanged"])
+        self.assertEqual((stats["inserted"], stats["updated"], stats["deleted"]), (0, 0, 0))
+
+    def test_same_revision_skips_sheet_read(self):
+        self.ws.spreadsheet = FakeSpreadsheet()
+        self.catalog.sync()
+        requests = self.ws.requests
+        self.ws.values[1][3] = 0  # правка без новой ревизии не видна до её смены
+        self.assertTrue(self.catalog.sync()["unchanged"])
+        self.assertEqual(self.ws.requests, requests)
+        self.assertEqual(self.catalog.get_by_code("4792252000000")["stock"], 10)
+        self.ws.spreadsheet.revision = "r2"
+        self.assertEqual(self.catalog.sync()["updated"], 1)
+        self.assertEqual(self.catalog.get_by_code("4792252000000")["stock"], 0)
+
+    def test_lots_of_repeated_code_keep_sheet_order(self):
+        self.ws.values[1:] = [
+            stock_row("4792252111111", 9, "01.01.2028"),
+            stock_row("4792252000001", 3),
+            stock_row("4792252111111", 5, "01.06.2028"),
+        ]
+        self.catalog.sync()
+        self.ws.values[1][3] = 8  # остаток первой партии
+        self.assertEqual(self.catalog.sync()["updated"], 1)
+        first = self.catalog.get_by_code("4792252111111")
+        self.assertEqual((first["stock"], first["expiry"]), (8, "01.01.2028"))
+        self.assertEqual([p["stock"] for p in self.catalog.find_by_code_ending("1111")], [8, 5])
+        self.assertEqual([p["stock"] for p in self.catalog.find_by_extra_code("T4792252111111")], [8, 5])
+
+    def test_rows_without_code_are_kept(self):
+        self.ws.values[1:] = [stock_row("", 1, name="sample A"), stock_row("", 2, name="sample B")]
+        self.catalog.sync()
+        self.assertEqual([p["stock"] for p in self.catalog.all()], [1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+"""TempOrders: сохранение черновика читает лист один раз и пишет только строки пользователя."""
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import sheets
+from fakes import FakeWorksheet
+
+
+class CountingWorksheet(FakeWorksheet):
+    """Лист в памяти, который запоминает каждый вызов API."""
+
+    def __init__(self, values):
+        super().__init__(values)
+        self.calls = []
+
+    def get_all_values(self):
+        self.calls.append(("get_all_values",))
+        return super().get_all_values()
+
+    def update(self, values, range_name="A1"):
+        self.calls.append(("update", range_name))
+        super().update(values, range_name)
+
+    def batch_update(self, data):
+        self.calls.append(("batch_update", [item["range"] for item in data]))
+        super().batch_update(data)
+
+
+def draft(client, *codes):
+    return {
+        "client": client,
+        "note": "",
+        "products": [{"code": code, "name": f"tea {code}", "qty": 1, "price": 4.25} for code in codes],
+    }
+
+
+def sheet_row(user_id, client, code):
+    return ["2026-01-01 10:00", user_id, client, code, f"tea {code}", "1", "4.25", ""]
+
+
+class SaveUserOrderStateTest(unittest.TestCase):
+    def setUp(self):
+        self.ws = CountingWorksheet([
+            sheets.TEMP_ORDERS_HEADER,
+            sheet_row("1", "Alpha", "A1"),
+            sheet_row("2", "Beta", "B1"),
+            sheet_row("2", "Beta", "B2"),
+            sheet_row("3", "Gamma", "C1"),
+        ])
+        sheets._temp_orders_ws = self.ws
+        sheets._row_index = None
+
+    def tearDown(self):
+        sheets._temp_orders_ws = None
+        sheets._row_index = None
+
+    def user_rows(self, user_id):
+        return [row[3] for row in self.ws.values[1:] if len(row) > 1 and row[1] == user_id]
+
+    def test_one_read_and_one_write(self):
+        sheets.save_user_order_state(2, draft("Beta", "B3"))
+        names = [call[0] for call in self.ws.calls]
+        self.assertEqual(names, ["get_all_values", "batch_update"])
+
+    def test_writes_only_own_rows(self):
+        before = [list(row) for row in self.ws.values]
+        sheets.save_user_order_state(2, draft("Beta", "B3"))
+        # Одна строка вместо двух: первая перезаписана, вторая очищена, остальные не тронуты
+        self.assertEqual(self.ws.calls[-1], ("batch_update", ["A3:H4"]))
+        self.assertEqual(self.ws.values[1], before[1])
+        self.assertEqual(self.ws.values[4], before[4])
+        self.assertEqual(self.user_rows("2"), ["B3"])
+        self.assertEqual(self.user_rows("1"), ["A1"])
+        self.assertEqual(self.user_rows("3"), ["C1"])
+
+    def test_extra_rows_go_to_free_rows_and_sheet_end(self):
+        sheets.save_user_order_state(1, None)
+        sheets.save_user_order_state(4, draft("Delta", "D1", "D2"))
+        # D1 занимает освободившуюся строку 2, D2 дописывается в конец
+        self.assertEqual(self.ws.calls[-1], ("batch_update", ["A2:H2", "A6:H6"]))
+        self.assertEqual(self.user_rows("4"), ["D1", "D2"])
+        self.assertEqual(self.user_rows("2"), ["B1", "B2"])
+        self.assertEqual(sheets._row_index["4"], [(2, 2), (6, 6)])
+
+    def test_load_after_save_uses_written_layout(self):
+        sheets.save_user_order_state(2, draft("Beta", "B3", "B4", "B5"))
+        state = sheets.load_user_order_state(2)
+        self.assertEqual([p["code"] for p in state["products"]], ["B3", "B4", "B5"])
+        self.assertEqual(state["client"], "Beta")
+
+    def test_empty_sheet_gets_header(self):
+        self.ws.values = []
+        sheets.save_user_order_state(1, draft("Alpha", "A1"))
+        self.assertEqual(self.ws.values[0], sheets.TEMP_ORDERS_HEADER)
+        self.assertEqual(self.user_rows("1"), ["A1"])
+
+
+
+class StaleColumnWorksheet(FakeWorksheet):
+    """Лист, колонка UserID которого читается уже устаревшей: строки успели сдвинуть."""
+
+    def __init__(self, values, user_column):
+        super().__init__(values)
+        self.user_column = user_column
+
+    def col_values(self, col):
+        self.requests += 1
+        return list(self.user_column)
+
+
+class DeleteUserOrderStateTest(unittest.TestCase):
+    def tearDown(self):
+        sheets._temp_orders_ws = None
+        sheets._row_index = None
+
+    def test_rows_of_other_users_survive_stale_index(self):
+        # По колонке у пользователя 2 строки 3-4, но в строке 4 уже заказ пользователя 3
+        ws = StaleColumnWorksheet([
+            sheets.TEMP_ORDERS_HEADER,
+            sheet_row("1", "Alpha", "A1"),
+            sheet_row("2", "Beta", "B1"),
+            sheet_row("3", "Gamma", "C1"),
+        ], ["UserID", "1", "2", "2"])
+        sheets._temp_orders_ws = ws
+        sheets._row_index = None
+
+        sheets.delete_user_order_state(2)
+        self.assertEqual([row[1] for row in ws.values[1:]], ["1", "3"])
+
+
+if __name__ == "__main__":
+    unittest.main()
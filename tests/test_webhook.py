@@ -0,0 +1,96 @@
+"""Режим вебхука: секрет обязателен, чужие POST отклоняются, свои доходят до обработчиков."""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+TMP = tempfile.mkdtemp()
+os.environ.update({
+    "BOT_TOKEN": "123456:TEST-TOKEN",
+    "EMAIL_SENDER": "bot@example.com",
+    "EMAIL_PASSWORD": "secret",
+    "EMAIL_RECIPIENT": "accountant@example.com",
+    "RUN_MODE": "webhook",
+    "WEBHOOK_BASE_URL": "https://bot.example.com",
+    "WEBHOOK_SECRET": "local-secret",
+    "TEMP_ORDERS_SYNC": "0",
+    "FSM_DB": os.path.join(TMP, "fsm.db"),
+    "REPORTS_FILE": os.path.join(TMP, "sales_rollups.json"),
+    "ARCHIVE_DIR": os.path.join(TMP, "orders_archive"),
+})
+
+from aiohttp.test_utils import TestClient, TestServer
+
+import main
+import orders
+from fakes import FakeSession
+
+# archive мог быть импортирован другим тестом раньше, чем выставлен ARCHIVE_DIR
+orders.ORDERS_FILE = os.path.join(TMP, "orders_data.json")
+orders.ARCHIVE_DIR = os.path.join(TMP, "orders_archive")
+orders.ARCHIVE_FILE = os.path.join(TMP, "orders_archive.jsonl")
+orders.LEGACY_ARCHIVE_FILE = os.path.join(TMP, "orders_archive.json")
+
+
+def message_update(update_id, user_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Manager"},
+            "text": text,
+        },
+    }
+
+
+async def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("обработчик не ответил вовремя")
+        await asyncio.sleep(0.001)
+
+
+class WebhookAppTest(unittest.IsolatedAsyncioTestCase):
+    def test_missing_secret_is_rejected(self):
+        with mock.patch.object(main, "WEBHOOK_SECRET", None):
+            with self.assertRaises(ValueError):
+                main.create_webhook_app()
+
+    async def test_updates_need_the_secret_header(self):
+        session = FakeSession()
+        main.bot.session = session
+        headers = {"X-Telegram-Bot-Api-Secret-Token": main.WEBHOOK_SECRET}
+
+        async with TestClient(TestServer(main.create_webhook_app())) as client:
+            self.assertEqual(session.calls[0][0], "setWebhook")
+            self.assertEqual(session.calls[0][1].secret_token, main.WEBHOOK_SECRET)
+
+            for wrong in ({}, {"X-Telegram-Bot-Api-Secret-Token": "guess"}):
+                resp = await client.post(main.WEBHOOK_PATH, json=message_update(1, 1, "/start"), headers=wrong)
+                self.assertEqual(resp.status, 401)
+            self.assertEqual(session.sent_texts(1), [])
+
+            user_id = 1000
+            for update_id, (text, expected) in enumerate(
+                    (("/start", "Введите ваше имя"), ("Nikita", "Введите имя клиента")), start=2):
+                before = len(session.sent_texts(user_id))
+                resp = await client.post(main.WEBHOOK_PATH, json=message_update(update_id, user_id, text),
+                                         headers=headers)
+                self.assertEqual(resp.status, 200)
+                await wait_for(lambda: len(session.sent_texts(user_id)) > before)
+                self.assertIn(expected, session.sent_texts(user_id)[-1])
+            self.assertEqual(orders.get_order(user_id)["manager"], "Nikita")
+
+
+if __name__ == "__main__":
+    unittest.main()